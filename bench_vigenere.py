@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+
+### bench_vigenere.py
+### Benchmarks for the cipher engine, key schedule and file I/O paths in vigenere.py.
+### Results are written out as JSON, so a run can be kept as a baseline and later
+### runs compared against it to catch regressions.
+
+import vigenere,randchars,os,sys,json,platform,tempfile,subprocess;
+from time import perf_counter;
+from datetime import datetime;
+
+# sizes used when none are given
+SIZES_DEF="1K,64K,1M";
+# key lengths used when none are given
+KEYLENS_DEF="1,64,4K";
+# sizes and key lengths used for a full run (1 KB to 1 GB, 1 byte to 1 MB)
+SIZES_FULL="1K,32K,1M,32M,1G";
+KEYLENS_FULL="1,16,1K,64K,1M";
+# largest message size timed in memory; larger sizes are only timed through encodeFile()/decodeFile(),
+# since the in-memory functions extend the key over the whole message at once, which takes time
+# quadratic in its length, and hold several copies of it
+INMEM_MAX=1024*1024;
+# key length used when varying the message size
+KEYLEN_FIXED=64;
+# message size used when varying the key length
+SIZE_FIXED=64*1024;
+# how long a key to generate when benchmarking extTrimKey()
+KEYSCHED_LEN=256*1024;
+# default regression threshold (fraction slower than the baseline)
+THRESHOLD_DEF=0.10;
+# seed for generated data, so every run works on the same bytes
+DATA_SEED=0x5EED;
+# batch sizes, record size and number of distinct keys for the encodeMany()/decodeMany() cases
+MANY_COUNTS=(1,64,1024);
+MANY_RECSIZE=256;
+MANY_KEYS=8;
+# worker counts used by 'engines' when none are given
+WORKERS_DEF="2,4";
+# file size and buffer sizes tried by 'tune' when none are given
+TUNE_SIZE_DEF="4M";
+BUFSIZES_DEF="256K,1M,4M";
+# fraction faster a setting must be than a simpler one tried before it for 'tune' to prefer it
+TUNE_MARGIN=0.05;
+# modules whose import time is measured by 'startup'
+STARTUP_MODULES=("vigenere","graphics_o","vigenere_kf","vigenere_d");
+
+# usage
+def usage(sname):
+	print("Usage:",sname,"run [OUTPUT] [--sizes LIST] [--keylens LIST] [--repeat N] [--mix R,T,Z] [--full]");
+	print("      ",sname,"startup [OUTPUT] [--repeat N]");
+	print("      ",sname,"engines [OUTPUT] [--sizes LIST] [--workers LIST] [--repeat N]");
+	print("      ",sname,"tune [OUTPUT] [--sizes SIZE] [--workers LIST] [--bufsizes LIST] [--repeat N] [--profile PATH]");
+	print("      ",sname,"compare BASELINE CURRENT [THRESHOLD]");
+
+# full fledged help
+def helpmsg(sname):
+	usage(sname);
+	print("    run        Run the benchmarks, writing results as JSON to OUTPUT (or stdout)");
+	print("    startup    Time interpreter startup and the import of each module, in a fresh interpreter each time");
+	print("    engines    Time encodeFile() and rekeyFile() with worker processes, handing blocks to them by pickling or through shared memory");
+	print("    tune       Time encodeFile() with each number of worker processes, engine and buffer size, and save the");
+	print("               fastest as this host's tuning profile, used by default from then on");
+	print("    compare    Compare CURRENT results with BASELINE results; exits with status 1 on regressions");
+	print("    OUTPUT     Path to write results to");
+	print("    BASELINE   Path to earlier results");
+	print("    CURRENT    Path to new results");
+	print("    THRESHOLD  Fraction slower than the baseline a case may be before it is flagged (default "+str(THRESHOLD_DEF)+")");
+	print("    --sizes    Comma-separated message sizes, e.g. 1K,1M,1G (default "+SIZES_DEF+")");
+	print("    --keylens  Comma-separated key lengths, e.g. 1,1K,1M (default "+KEYLENS_DEF+")");
+	print("    --repeat   Number of times to run each case; the fastest run is kept (default 3)");
+	print("    --mix      Proportions of random, text-like and zero-filled regions in messages (default "+",".join(str(part) for part in randchars.MIX_DEF)+")");
+	print("    --full     Use sizes "+SIZES_FULL+" and key lengths "+KEYLENS_FULL+" (slow)");
+	print("               (sizes over "+fmtSize(INMEM_MAX)+" are only timed through encodeFile() and decodeFile())");
+	print("    --workers  Comma-separated worker process counts for 'engines' and 'tune' (default "+WORKERS_DEF+")");
+	print("    --sizes    For 'tune', the size of the file to time with (default "+TUNE_SIZE_DEF+")");
+	print("    --bufsizes Comma-separated buffer sizes for 'tune', rounded up to whole blocks (default "+BUFSIZES_DEF+")");
+	print("    --profile  Path to save the tuning profile to (default $VIGENERE_PROFILE, or "+vigenere.profilePath()+")");
+
+# turn a number of bytes back into a short size string
+def fmtSize(nbytes):
+	for suffix,mult in (("G",1024**3),("M",1024**2),("K",1024)):
+		if nbytes>=mult and nbytes%mult==0:
+			return str(nbytes//mult)+suffix;
+	return str(nbytes);
+
+# generate reproducible test data
+def genData(nbytes,seedval=DATA_SEED,mix=randchars.MIX_DEF):
+	return randchars.doCorpus(nbytes,seedval,mix);
+
+# time a function, keeping the fastest of several runs
+def timeIt(func,nbytes,repeat):
+	""" Run func repeat times and return the result for the fastest run.
+	:param func: Function to time (called with no arguments)
+	:param nbytes: Number of bytes func processes per call
+	:param repeat: Number of runs
+	:return: Dictionary of seconds, bytes and bytes per second
+	"""
+	best=None;
+	for i in range(repeat):
+		starttime=perf_counter();
+		func();
+		tdelta=perf_counter()-starttime;
+		if best is None or tdelta<best:
+			best=tdelta;
+	return {"seconds":best,"bytes":nbytes,"bytes_per_sec":(best>0 and nbytes/best or 0.0)};
+
+# run every benchmark case
+def doRun(sizes,keylens,repeat,log=sys.stderr,mix=randchars.MIX_DEF):
+	""" Run the benchmark cases and return the results.
+	:param sizes: List of message sizes, in bytes
+	:param keylens: List of key lengths, in bytes
+	:param repeat: Number of times to run each case
+	:param log: File to report each result to as it finishes
+	:param mix: Proportions of random, text-like and zero-filled regions in messages
+	:return: Results as a dictionary, ready to be written as JSON
+	"""
+	results={};
+	def record(name,res):
+		results[name]=res;
+		print("{0:<40} {1:>12.2f} KiB/s".format(name,res["bytes_per_sec"]/1024),file=log);
+	# key schedule: extTrimKey() for each key length
+	for keylen in keylens:
+		key=genData(keylen,DATA_SEED+1);
+		record("extTrimKey klen="+fmtSize(keylen),timeIt(lambda: vigenere.extTrimKey(key,KEYSCHED_LEN),KEYSCHED_LEN,repeat));
+	# key schedule: msgKeyPreprocess() for each key length at a fixed size, and each size at a fixed key length
+	msg=genData(SIZE_FIXED,DATA_SEED,mix);
+	for keylen in keylens:
+		key=genData(keylen,DATA_SEED+1);
+		record("msgKeyPreprocess size="+fmtSize(SIZE_FIXED)+" klen="+fmtSize(keylen),timeIt(lambda: vigenere.msgKeyPreprocess(msg,key),SIZE_FIXED,repeat));
+	key=genData(KEYLEN_FIXED,DATA_SEED+1);
+	inmemsizes=[size for size in sizes if size<=INMEM_MAX];
+	for size in inmemsizes:
+		msg=genData(size,DATA_SEED,mix);
+		record("msgKeyPreprocess size="+fmtSize(size)+" klen="+fmtSize(KEYLEN_FIXED),timeIt(lambda: vigenere.msgKeyPreprocess(msg,key),size,repeat));
+	# cipher engine: doDataEncode() and doDataDecode() on in-memory data, with and without compression
+	for size in inmemsizes:
+		msg=genData(size,DATA_SEED,mix);
+		for gz in (False,True):
+			suffix=" size="+fmtSize(size)+" gz="+str(int(gz));
+			ctext=vigenere.doDataEncode(msg,key,gz);
+			record("doDataEncode"+suffix,timeIt(lambda: vigenere.doDataEncode(msg,key,gz),size,repeat));
+			record("doDataDecode"+suffix,timeIt(lambda: vigenere.doDataDecode(ctext,key,gz),size,repeat));
+	# small records: encodeMany() and decodeMany() for each batch size, against doDataEncode() one record at a time
+	keys=[genData(KEYLEN_FIXED,DATA_SEED+2+i) for i in range(MANY_KEYS)];
+	for count in MANY_COUNTS:
+		pairs=[(genData(MANY_RECSIZE,DATA_SEED+i,mix),keys[i%MANY_KEYS]) for i in range(count)];
+		cpairs=list(zip(vigenere.encodeMany(pairs),(key for msg,key in pairs)));
+		suffix=" records="+str(count)+" size="+fmtSize(MANY_RECSIZE);
+		record("doDataEncode"+suffix,timeIt(lambda: [vigenere.doDataEncode(msg,key) for msg,key in pairs],count*MANY_RECSIZE,repeat));
+		record("encodeMany"+suffix,timeIt(lambda: vigenere.encodeMany(pairs),count*MANY_RECSIZE,repeat));
+		record("decodeMany"+suffix,timeIt(lambda: vigenere.decodeMany(cpairs),count*MANY_RECSIZE,repeat));
+	# file I/O: encodeFile() and decodeFile() on temporary files
+	# (without compression, since files compressed block by block cannot be split back into blocks;
+	# and with fixed settings rather than this host's tuning profile, so runs stay comparable)
+	filesettings={"workers":1,"engine":vigenere.ENGINE_DEF,"bufsize":vigenere.PIPE_BUFSIZE};
+	with tempfile.TemporaryDirectory() as tmpdir:
+		ppath=os.path.join(tmpdir,"plain");
+		cpath=os.path.join(tmpdir,"cipher");
+		dpath=os.path.join(tmpdir,"decipher");
+		for size in sizes:
+			# (written a region at a time, so large sizes needn't fit in memory)
+			with open(ppath,"wb") as pfile:
+				randchars.writeChunks(pfile,randchars.genCorpusChunks(size,DATA_SEED,mix));
+			suffix=" size="+fmtSize(size);
+			# keep the library's timing messages out of the way
+			stdout,sys.stdout=sys.stdout,open(os.devnull,"w");
+			try:
+				encres=timeIt(lambda: vigenere.encodeFile(ppath,cpath,key,**filesettings),size,repeat);
+				decres=timeIt(lambda: vigenere.decodeFile(cpath,dpath,key,**filesettings),size,repeat);
+			finally:
+				sys.stdout.close();
+				sys.stdout=stdout;
+			record("encodeFile"+suffix,encres);
+			record("decodeFile"+suffix,decres);
+	return {
+		"meta":{
+			"date":datetime.now().isoformat(),
+			"python":platform.python_version(),
+			"platform":platform.platform(),
+			"blksize":vigenere.BLKSIZE,
+			"repeat":repeat,
+			"mix":mix,
+			"inmem_max":INMEM_MAX,
+			"file_settings":filesettings
+		},
+		"results":results
+	};
+
+# time the parallel engines
+def doEngines(sizes,workerlist,repeat,log=sys.stderr):
+	""" Time encodeFile() and rekeyFile() on temporary files in this process, and with each number of
+	worker processes for each of vigenere.ENGINES.
+	:param sizes: List of file sizes, in bytes
+	:param workerlist: List of numbers of worker processes
+	:param repeat: Number of times to run each case
+	:param log: File to report each result to as it finishes
+	:return: Results as a dictionary, ready to be written as JSON
+	"""
+	results={};
+	key=genData(KEYLEN_FIXED,DATA_SEED+1);
+	newkey=genData(KEYLEN_FIXED,DATA_SEED+2);
+	with tempfile.TemporaryDirectory() as tmpdir:
+		ppath=os.path.join(tmpdir,"plain");
+		cpath=os.path.join(tmpdir,"cipher");
+		rpath=os.path.join(tmpdir,"rekeyed");
+		for size in sizes:
+			with open(ppath,"wb") as pfile:
+				pfile.write(genData(size));
+			for workers,engine in [(1,"serial")]+[(workers,engine) for workers in workerlist for engine in vigenere.ENGINES]:
+				suffix=" size="+fmtSize(size)+" workers="+str(workers)+" engine="+engine;
+				engine=(workers>1 and engine or vigenere.ENGINE_DEF);
+				# keep the library's timing messages out of the way
+				stdout,sys.stdout=sys.stdout,open(os.devnull,"w");
+				try:
+					encres=timeIt(lambda: vigenere.encodeFile(ppath,cpath,key,workers=workers,engine=engine),size,repeat);
+					rekres=timeIt(lambda: vigenere.rekeyFile(cpath,rpath,key,newkey,workers=workers,engine=engine),size,repeat);
+				finally:
+					sys.stdout.close();
+					sys.stdout=stdout;
+				for name,res in (("encodeFile"+suffix,encres),("rekeyFile"+suffix,rekres)):
+					results[name]=res;
+					print("{0:<50} {1:>12.2f} KiB/s".format(name,res["bytes_per_sec"]/1024),file=log);
+	return {
+		"meta":{
+			"date":datetime.now().isoformat(),
+			"python":platform.python_version(),
+			"platform":platform.platform(),
+			"cpus":os.cpu_count(),
+			"blksize":vigenere.BLKSIZE,
+			"repeat":repeat
+		},
+		"results":results
+	};
+
+# find the fastest settings for this host
+def doTune(size,workerlist,bufsizes,repeat,log=sys.stderr):
+	""" Time encodeFile() on a temporary file in this process, and with each number of worker processes
+	for each of vigenere.ENGINES, at each buffer size, and pick the fastest (settings tried later, which
+	use more processes or memory, must be TUNE_MARGIN faster to be picked). The block size itself
+	can't be tuned, since the key schedule depends on it.
+	:param size: File size, in bytes
+	:param workerlist: List of numbers of worker processes
+	:param bufsizes: List of buffer sizes, in bytes
+	:param repeat: Number of times to run each case
+	:param log: File to report each result to as it finishes
+	:return: Results as a dictionary, ready to be written as JSON, with the fastest settings under 'chosen'
+	"""
+	results={};
+	chosen=None;
+	best=None;
+	key=genData(KEYLEN_FIXED,DATA_SEED+1);
+	with tempfile.TemporaryDirectory() as tmpdir:
+		ppath=os.path.join(tmpdir,"plain");
+		cpath=os.path.join(tmpdir,"cipher");
+		with open(ppath,"wb") as pfile:
+			pfile.write(genData(size));
+		for bufsize in bufsizes:
+			bufsize=vigenere.tunedSettings(1,vigenere.ENGINE_DEF,bufsize)[2];
+			for workers,engine in [(1,"serial")]+[(workers,engine) for workers in workerlist if workers>1 for engine in vigenere.ENGINES]:
+				name="encodeFile size="+fmtSize(size)+" workers="+str(workers)+" engine="+engine+" bufsize="+fmtSize(bufsize);
+				engine=(workers>1 and engine or vigenere.ENGINE_DEF);
+				# keep the library's timing messages out of the way
+				stdout,sys.stdout=sys.stdout,open(os.devnull,"w");
+				try:
+					res=timeIt(lambda: vigenere.encodeFile(ppath,cpath,key,workers=workers,engine=engine,bufsize=bufsize),size,repeat);
+				finally:
+					sys.stdout.close();
+					sys.stdout=stdout;
+				results[name]=res;
+				print("{0:<60} {1:>12.2f} KiB/s".format(name,res["bytes_per_sec"]/1024),file=log);
+				if best is None or res["seconds"]<best*(1-TUNE_MARGIN):
+					best=res["seconds"];
+					chosen={"workers":workers,"engine":engine,"bufsize":bufsize};
+	return {
+		"meta":{
+			"date":datetime.now().isoformat(),
+			"python":platform.python_version(),
+			"platform":platform.platform(),
+			"cpus":os.cpu_count(),
+			"blksize":vigenere.BLKSIZE,
+			"repeat":repeat
+		},
+		"chosen":chosen,
+		"results":results
+	};
+
+# time interpreter startup and module imports
+def doStartup(repeat,log=sys.stderr):
+	""" Time starting a fresh interpreter, and starting one and importing each of STARTUP_MODULES.
+	:param repeat: Number of times to run each case
+	:param log: File to report each result to as it finishes
+	:return: Results as a dictionary, ready to be written as JSON (bytes are 0 for these cases)
+	"""
+	results={};
+	here=os.path.dirname(os.path.abspath(__file__));
+	for name,code in [("startup interpreter","pass")]+[("startup import "+mod,"import "+mod) for mod in STARTUP_MODULES]:
+		res=timeIt(lambda: subprocess.run([sys.executable,"-c",code],cwd=here,check=True),0,repeat);
+		results[name]=res;
+		print("{0:<40} {1:>12.2f} ms".format(name,res["seconds"]*1000),file=log);
+	return {
+		"meta":{
+			"date":datetime.now().isoformat(),
+			"python":platform.python_version(),
+			"platform":platform.platform(),
+			"repeat":repeat
+		},
+		"results":results
+	};
+
+# compare two sets of results
+def doCompare(baseline,current,threshold=THRESHOLD_DEF):
+	""" Compare benchmark results against a baseline.
+	:param baseline: Baseline results (as returned by doRun())
+	:param current: New results (as returned by doRun())
+	:param threshold: Fraction slower than the baseline a case may be before it is flagged
+	:return: List of (name, baseline result, current result, change) for every case in both, and list of names of regressed cases
+	"""
+	rows=[];
+	regressed=[];
+	for name,baseres in baseline["results"].items():
+		if name not in current["results"]:
+			continue;
+		curres=current["results"][name];
+		# compare throughput, or for cases that don't process bytes (such as startup), time
+		if baseres["bytes"]:
+			change=(baseres["bytes_per_sec"]>0 and curres["bytes_per_sec"]/baseres["bytes_per_sec"]-1 or 0.0);
+		else:
+			change=(curres["seconds"]>0 and baseres["seconds"]/curres["seconds"]-1 or 0.0);
+		rows.append((name,baseres,curres,change));
+		if change<-threshold:
+			regressed.append(name);
+	return rows,regressed;
+
+# command line mode, accept arguments
+def onCmdLine():
+	# name of this script
+	thisis=sys.argv[0];
+	args=sys.argv[:];
+	try:
+		sizesopt=vigenere.popOpt(args,"--sizes");
+		sizes=(sizesopt or SIZES_DEF);
+		keylens=vigenere.popOpt(args,"--keylens",KEYLENS_DEF);
+		repeat=int(vigenere.popOpt(args,"--repeat","3"));
+		workerlist=[int(workers) for workers in vigenere.popOpt(args,"--workers",WORKERS_DEF).split(",")];
+		bufsizes=[vigenere.parseSize(bufsize) for bufsize in vigenere.popOpt(args,"--bufsizes",BUFSIZES_DEF).split(",")];
+		if min(bufsizes)<=0:
+			raise ValueError("invalid buffer size",bufsizes);
+		ppath=vigenere.popOpt(args,"--profile");
+		mix=tuple(float(part) for part in vigenere.popOpt(args,"--mix",",".join(str(part) for part in randchars.MIX_DEF)).split(","));
+		if len(mix)!=3 or min(mix)<0 or sum(mix)<=0:
+			raise ValueError("invalid mix",mix);
+		if "--full" in args:
+			args.remove("--full");
+			sizes,keylens=SIZES_FULL,KEYLENS_FULL;
+		sizes=[vigenere.parseSize(size) for size in sizes.split(",")];
+		tunesize=max(vigenere.parseSize(size) for size in (sizesopt or TUNE_SIZE_DEF).split(","));
+		keylens=[vigenere.parseSize(keylen) for keylen in keylens.split(",")];
+	except ValueError:
+		usage(thisis);
+		print("Invalid option value");
+		exit(2);
+	mode=(len(args)>=2 and args[1] or None);
+	if mode=="help":
+		helpmsg(thisis);
+		exit(0);
+	elif mode=="run":
+		results=doRun(sizes,keylens,repeat,mix=mix);
+		if len(args)>=3:
+			with open(args[2],"w") as ofile:
+				json.dump(results,ofile,indent=1);
+		else:
+			print(json.dumps(results,indent=1));
+	elif mode in ("startup","engines"):
+		results=(mode=="startup" and doStartup(repeat) or doEngines(sizes,workerlist,repeat));
+		if len(args)>=3:
+			with open(args[2],"w") as ofile:
+				json.dump(results,ofile,indent=1);
+		else:
+			print(json.dumps(results,indent=1));
+	elif mode=="tune":
+		results=doTune(tunesize,workerlist,bufsizes,repeat);
+		if len(args)>=3:
+			with open(args[2],"w") as ofile:
+				json.dump(results,ofile,indent=1);
+		vigenere.saveProfile(results["chosen"],results["results"],ppath);
+		print("Chose",", ".join(name+"="+str(value) for name,value in results["chosen"].items()),
+			"for this host, saved to",(ppath or vigenere.profilePath()),file=sys.stderr);
+	elif mode=="compare" and len(args)>=4:
+		with open(args[2]) as bfile:
+			baseline=json.load(bfile);
+		with open(args[3]) as cfile:
+			current=json.load(cfile);
+		threshold=(len(args)>=5 and float(args[4]) or THRESHOLD_DEF);
+		rows,regressed=doCompare(baseline,current,threshold);
+		for name,baseres,curres,change in rows:
+			if baseres["bytes"]:
+				figures=(baseres["bytes_per_sec"]/1024,curres["bytes_per_sec"]/1024,"KiB/s");
+			else:
+				figures=(baseres["seconds"]*1000,curres["seconds"]*1000,"ms   ");
+			print("{0:<40} {1:>12.2f} {2:>12.2f} {3} {4:>+8.1%}{5}".format(
+				name,*figures,change,(name in regressed and "  REGRESSION" or "")
+			));
+		if regressed:
+			print(len(regressed),"case(s) regressed by more than {0:.0%}".format(threshold));
+			exit(1);
+	else:
+		usage(thisis);
+		print("Try '"+thisis+" help' for more information.");
+		exit(2);
+
+if __name__=="__main__":
+	onCmdLine();
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+### conformance.py
+### Checks that an engine (by default vigenere.py itself) produces byte-identical results
+### to the frozen reference in refvigenere.py, so faster implementations can be swapped in
+### safely. An engine is any module with extTrimKey, doDataEncode, doDataDecode and
+### msgKeyPreprocess functions. If it also has encodeMany and decodeMany, diff checks
+### their results against the reference's doDataEncode and doDataDecode.
+###   gen    writes golden vectors computed by the reference, across key lengths,
+###          message lengths and block boundaries
+###   check  checks an engine against the golden vectors
+###   diff   runs an engine and the reference side by side on random inputs, reporting
+###          the throughput of each
+
+import vigenere,refvigenere,sys,json,importlib;
+from hashlib import sha256;
+from random import Random;
+from time import perf_counter;
+
+# default path to golden vectors
+VECTORS_DEF="conformance_vectors.json";
+# default engine to check
+ENGINE_DEF="vigenere";
+# key and message lengths used for golden vectors (chosen to straddle block boundaries)
+GOLDEN_KEYLENS=(1,2,3,64,255,256,1000,8191,8192,8193,20000);
+GOLDEN_MSGLENS=(0,1,100,8191,8192,8193,16384,24577);
+# functions compared for each case
+FUNCS=("extTrimKey","doDataEncode","doDataDecode","msgKeyPreprocess");
+
+# usage
+def usage(sname):
+	print("Usage:",sname,"gen [VECTORS]");
+	print("      ",sname,"check [VECTORS] [--engine MODULE]");
+	print("      ",sname,"diff [ROUNDS] [SEED] [--engine MODULE]");
+
+# full fledged help
+def helpmsg(sname):
+	usage(sname);
+	print("    gen       Write golden vectors computed by the reference engine");
+	print("    check     Check an engine against the golden vectors");
+	print("    diff      Compare an engine with the reference engine on random inputs");
+	print("    VECTORS   Path to golden vectors (default "+VECTORS_DEF+")");
+	print("    ROUNDS    Number of random cases to run (default 100)");
+	print("    SEED      Seed for generating random cases (default 0)");
+	print("    --engine  Module to check (default "+ENGINE_DEF+")");
+
+# make the key and message for a case
+def mkInputs(klen,mlen,caseseed):
+	rng=Random(caseseed);
+	return rng.randbytes(klen),rng.randbytes(mlen);
+
+# hash a result so it can be compared or stored compactly
+def digest(result):
+	if isinstance(result,bytes):
+		return sha256(result).hexdigest();
+	# msgKeyPreprocess() returns two lists of blocks
+	hsh=sha256();
+	for blks in result:
+		for blk in blks:
+			hsh.update(len(blk).to_bytes(4,"big"));
+			hsh.update(blk);
+	return hsh.hexdigest();
+
+# run one case through an engine
+def runCase(engine,key,msg,gz=False):
+	""" Run each of FUNCS on the given key and message.
+	:param engine: Module to run
+	:param key: Key
+	:param msg: Message (also used as ciphertext for doDataDecode)
+	:param gz: Whether to compress/uncompress
+	:return: Dictionary of function name to result digest (or 'error:' and the exception name),
+	and dictionary of function name to seconds taken
+	"""
+	calls={
+		"extTrimKey":lambda: engine.extTrimKey(key,len(msg)),
+		"doDataEncode":lambda: engine.doDataEncode(msg,key,gz),
+		"doDataDecode":lambda: engine.doDataDecode(msg,key,gz),
+		"msgKeyPreprocess":lambda: engine.msgKeyPreprocess(msg,key)
+	};
+	results={};
+	times={};
+	for fname in FUNCS:
+		starttime=perf_counter();
+		try:
+			res=calls[fname]();
+			results[fname]=(res is None and "none" or digest(res));
+		except Exception as exc:
+			results[fname]="error:"+type(exc).__name__;
+		times[fname]=perf_counter()-starttime;
+	return results,times;
+
+# generate golden vectors
+def doGen(vpath):
+	vectors=[];
+	for caseseed,(klen,mlen) in enumerate((k,m) for k in GOLDEN_KEYLENS for m in GOLDEN_MSGLENS):
+		key,msg=mkInputs(klen,mlen,caseseed);
+		results,times=runCase(refvigenere,key,msg);
+		vectors.append({"klen":klen,"mlen":mlen,"seed":caseseed,"results":results});
+	with open(vpath,"w") as vfile:
+		json.dump({"blksize":refvigenere.BLKSIZE,"vectors":vectors},vfile,indent=1);
+	print("Wrote",len(vectors),"vectors to",vpath);
+
+# check an engine against golden vectors
+def doCheck(engine,vpath):
+	""" Check an engine against the golden vectors at vpath.
+	:param engine: Module to check
+	:param vpath: Path to golden vectors
+	:return: List of (klen, mlen, function name) that did not match
+	"""
+	with open(vpath) as vfile:
+		vectors=json.load(vfile)["vectors"];
+	failed=[];
+	for vec in vectors:
+		key,msg=mkInputs(vec["klen"],vec["mlen"],vec["seed"]);
+		results,times=runCase(engine,key,msg);
+		for fname in FUNCS:
+			if results[fname]!=vec["results"][fname]:
+				failed.append((vec["klen"],vec["mlen"],fname));
+	return failed;
+
+# pick a length, favouring those near block boundaries
+def pickLen(rng,maxlen):
+	if rng.random()<0.5:
+		return max(1,rng.randint(1,4)*refvigenere.BLKSIZE+rng.randint(-2,2));
+	return rng.randint(1,maxlen);
+
+# compare an engine with the reference on random cases
+def doDiff(engine,rounds,diffseed):
+	""" Run random cases through an engine and the reference, stopping at the first mismatch.
+	:param engine: Module to check
+	:param rounds: Number of cases
+	:param diffseed: Seed for generating cases
+	:return: Description of the first mismatch, or None
+	"""
+	rng=Random(diffseed);
+	reftime=0.0;
+	enginetime=0.0;
+	nbytes=0;
+	# cases kept to check encodeMany()/decodeMany() with, by gz
+	batches={False:[],True:[]};
+	for rnd in range(rounds):
+		klen=(rng.random()<0.3 and rng.randint(1,8) or pickLen(rng,2*refvigenere.BLKSIZE));
+		mlen=(rng.random()<0.05 and 0 or pickLen(rng,4*refvigenere.BLKSIZE));
+		gz=rng.random()<0.25;
+		key,msg=mkInputs(klen,mlen,rng.getrandbits(32));
+		refres,reftimes=runCase(refvigenere,key,msg,gz);
+		engres,engtimes=runCase(engine,key,msg,gz);
+		reftime+=sum(reftimes.values());
+		enginetime+=sum(engtimes.values());
+		nbytes+=mlen*len(FUNCS);
+		for fname in FUNCS:
+			if refres[fname]!=engres[fname]:
+				return "round {0:d}: {1} differs (klen={2:d} mlen={3:d} gz={4})".format(rnd,fname,klen,mlen,gz);
+		# small records, so some keys are shared
+		batches[gz].append((msg[:rng.randint(0,300)],key[:rng.randint(1,3)]));
+	if hasattr(engine,"encodeMany"):
+		for gz,pairs in batches.items():
+			if engine.encodeMany(pairs,gz)!=[refvigenere.doDataEncode(msg,key,gz) for msg,key in pairs]:
+				return "encodeMany differs (gz={0})".format(gz);
+			if engine.decodeMany(pairs,gz)!=[refvigenere.doDataDecode(msg,key,gz) for msg,key in pairs]:
+				return "decodeMany differs (gz={0})".format(gz);
+	print("{0:d} rounds, {1:d} bytes".format(rounds,nbytes));
+	print("reference: {0:>12.2f} KiB/s".format(nbytes/1024/max(reftime,1e-9)));
+	print("engine:    {0:>12.2f} KiB/s ({1:.2f}x)".format(nbytes/1024/max(enginetime,1e-9),reftime/max(enginetime,1e-9)));
+	return None;
+
+# command line mode, accept arguments
+def onCmdLine():
+	# name of this script
+	thisis=sys.argv[0];
+	args=sys.argv[:];
+	try:
+		engine=importlib.import_module(vigenere.popOpt(args,"--engine",ENGINE_DEF));
+	except (ValueError,ImportError) as exc:
+		usage(thisis);
+		print("Cannot load engine:",str(exc));
+		exit(2);
+	mode=(len(args)>=2 and args[1] or None);
+	if mode=="help":
+		helpmsg(thisis);
+	elif mode=="gen":
+		doGen(len(args)>=3 and args[2] or VECTORS_DEF);
+	elif mode=="check":
+		failed=doCheck(engine,len(args)>=3 and args[2] or VECTORS_DEF);
+		for klen,mlen,fname in failed:
+			print("MISMATCH: {0} (klen={1:d} mlen={2:d})".format(fname,klen,mlen));
+		if failed:
+			exit(1);
+		print("All vectors match.");
+	elif mode=="diff":
+		try:
+			rounds=(len(args)>=3 and int(args[2]) or 100);
+			diffseed=(len(args)>=4 and int(args[3]) or 0);
+		except ValueError:
+			usage(thisis);
+			exit(2);
+		mismatch=doDiff(engine,rounds,diffseed);
+		if mismatch:
+			print("MISMATCH:",mismatch);
+			exit(1);
+	else:
+		usage(thisis);
+		print("Try '"+thisis+" help' for more information.");
+		exit(2);
+
+if __name__=="__main__":
+	onCmdLine();
@@ -26,6 +26,7 @@
 ### http://mcsp.wartburg.edu/zelle/python for a quick reference"""
 
 import time
+from contextlib import contextmanager
 
 try:  # import as appropriate for 2.x vs. 3.x
 	import tkinter as tk
@@ -45,11 +46,23 @@ UNSUPPORTED_METHOD = "Object doesn't support operation"
 BAD_OPTION = "Illegal option value"
 DEAD_THREAD = "Graphics thread quit unexpectedly"
 
-_root = tk.Tk()
-_root.withdraw()
+# Shortest time between two redraws of a window with autoflush on (seconds)
+FRAME_INTERVAL = 1/60.0
+
+# The hidden Tk root window; made by _getRoot() when first needed, so
+#	importing this module doesn't need a display
+_root = None
+
+def _getRoot():
+	global _root
+	if _root is None:
+		_root = tk.Tk()
+		_root.withdraw()
+	return _root
 
 def update():
-	_root.update()
+	if _root is not None:
+		_root.update()
 
 ############################################################################
 # Graphics classes start here
@@ -60,7 +73,7 @@ class GraphWin(tk.Canvas):
 
 	def __init__(self, title="Graphics Window",
 				 width=200, height=200, autoflush=True):
-		master = tk.Toplevel(_root)
+		master = tk.Toplevel(_getRoot())
 		master.protocol("WM_DELETE_WINDOW", self.close)
 		tk.Canvas.__init__(self, master, width=width, height=height)
 		self.master.title(title)
@@ -77,6 +90,13 @@ class GraphWin(tk.Canvas):
 		self._mouseCallback = None
 		self.trans = None
 		self.closed = False
+		# bumped on every click and on close, so waits on it wake up
+		# (owned by _root so it outlives the window)
+		self._eventVar = tk.IntVar(_root, 0)
+		# redraw scheduling state (see _scheduleFlush)
+		self._lastFlush = 0.0
+		self._flushPending = None
+		self._batchDepth = 0
 		master.lift()
 		if autoflush: _root.update()
 	 
@@ -101,7 +121,9 @@ class GraphWin(tk.Canvas):
 		if self.closed: return
 		self.closed = True
 		self.master.destroy()
-		self.__autoflush()
+		self._eventVar.set(self._eventVar.get()+1)
+		if self.autoflush:
+			_root.update()
 
 
 	def isClosed(self):
@@ -114,7 +136,46 @@ class GraphWin(tk.Canvas):
 
 	def __autoflush(self):
 		if self.autoflush:
-			_root.update()
+			self._scheduleFlush()
+
+	def _scheduleFlush(self):
+		# Mark the window as needing a redraw. It is redrawn right away
+		#	if it hasn't been for FRAME_INTERVAL, otherwise once the
+		#	interval is up, so a burst of changes costs one redraw.
+		#	The deferred redraw runs from the event loop; if it is due
+		#	and the event loop hasn't run it (a script drawing and
+		#	sleeping without handling events), it is done here instead.
+		#	Either way only idle tasks (the redraw) are run, not the
+		#	event loop, so no handler runs inside a drawing call.
+		if self._batchDepth or self.closed:
+			return
+		wait = self._lastFlush + FRAME_INTERVAL - time.perf_counter()
+		if wait <= 0:
+			if self._flushPending:
+				self.after_cancel(self._flushPending)
+				self._flushPending = None
+			self._lastFlush = time.perf_counter()
+			self.update_idletasks()
+		elif not self._flushPending:
+			self._flushPending = self.after(int(wait*1000)+1, self._doFlush)
+
+	def _doFlush(self):
+		self._flushPending = None
+		if not self.closed:
+			self._lastFlush = time.perf_counter()
+			self.update_idletasks()
+
+	@contextmanager
+	def batch(self):
+		"""Context manager that holds back redraws until the end of
+		the with block, then redraws once"""
+		self._batchDepth += 1
+		try:
+			yield self
+		finally:
+			self._batchDepth -= 1
+			if self.autoflush and not self._batchDepth:
+				self._scheduleFlush()
 
 	
 	def plot(self, x, y, color="black"):
@@ -143,9 +204,9 @@ class GraphWin(tk.Canvas):
 		self.mouseX = None
 		self.mouseY = None
 		while self.mouseX == None or self.mouseY == None:
-			self.update()
 			if self.isClosed(): raise GraphicsError("getMouse in closed window")
-			time.sleep(.1) # give up thread
+			# run the Tk event loop until a click or close bumps _eventVar
+			self.wait_variable(self._eventVar)
 		x,y = self.toWorld(self.mouseX, self.mouseY)
 		self.mouseX = None
 		self.mouseY = None
@@ -188,13 +249,22 @@ class GraphWin(tk.Canvas):
 			return x,y
 		
 	def setMouseHandler(self, func):
+		"""Call func with a Point (in window coordinates) for every
+		click, from the Tk event loop"""
 		self._mouseCallback = func
+
+	def waitClose(self):
+		"""Run the Tk event loop, calling mouse handlers and after()
+		callbacks as events arrive, until the window is closed"""
+		while not self.isClosed():
+			self.wait_variable(self._eventVar)
 		
 	def _onClick(self, e):
 		self.mouseX = e.x
 		self.mouseY = e.y
+		self._eventVar.set(self._eventVar.get()+1)
 		if self._mouseCallback:
-			self._mouseCallback(Point(e.x, e.y)) 
+			self._mouseCallback(Point(*self.toWorld(e.x, e.y)))
 
 class Transform:
 
@@ -280,7 +350,7 @@ class GraphicsObject:
 		self.canvas = graphwin
 		self.id = self._draw(graphwin, self.config)
 		if graphwin.autoflush:
-			_root.update()
+			graphwin._scheduleFlush()
 
 			
 	def undraw(self):
@@ -292,7 +362,7 @@ class GraphicsObject:
 		if not self.canvas.isClosed():
 			self.canvas.delete(self.id)
 			if self.canvas.autoflush:
-				_root.update()
+				self.canvas._scheduleFlush()
 		self.canvas = None
 		self.id = None
 
@@ -314,7 +384,7 @@ class GraphicsObject:
 				y = dy
 			self.canvas.move(self.id, x, y)
 			if canvas.autoflush:
-				_root.update()
+				canvas._scheduleFlush()
 		   
 	def _reconfig(self, option, setting):
 		# Internal method for changing configuration of the object
@@ -327,7 +397,7 @@ class GraphicsObject:
 		if self.canvas and not self.canvas.isClosed():
 			self.canvas.itemconfig(self.id, options)
 			if self.canvas.autoflush:
-				_root.update()
+				self.canvas._scheduleFlush()
 
 
 	def _draw(self, canvas, options):
@@ -469,8 +539,10 @@ class Entry(GraphicsObject):
 		self.anchor = p.clone()
 		#print self.anchor
 		self.width = width
-		self.text = tk.StringVar(_root)
-		self.text.set("")
+		# tk.StringVar holding the text, made when first drawn
+		#	(until then the text is kept in _text)
+		self.text = None
+		self._text = ""
 		self.fill = "gray"
 		self.color = "black"
 		self.font = DEFAULT_CONFIG['font']
@@ -479,6 +551,9 @@ class Entry(GraphicsObject):
 	def _draw(self, canvas, options):
 		p = self.anchor
 		x,y = canvas.toScreen(p.x,p.y)
+		if self.text is None:
+			self.text = tk.StringVar(_getRoot())
+			self.text.set(self._text)
 		frm = tk.Frame(canvas.master)
 		self.entry = tk.Entry(frm,
 							  width=self.width,
@@ -491,6 +566,8 @@ class Entry(GraphicsObject):
 		return canvas.create_window(x,y,window=frm)
 
 	def getText(self):
+		if self.text is None:
+			return self._text
 		return self.text.get()
 
 	def _move(self, dx, dy):
@@ -502,13 +579,15 @@ class Entry(GraphicsObject):
 	def clone(self):
 		other = Entry(self.anchor, self.width)
 		other.config = self.config.copy()
-		other.text = tk.StringVar()
-		other.text.set(self.text.get())
+		other.setText(self.getText())
 		other.fill = self.fill
 		return other
 
 	def setText(self, t):
-		self.text.set(t)
+		if self.text is None:
+			self._text = t
+		else:
+			self.text.set(t)
 
 			
 	def setFill(self, color):
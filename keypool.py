@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+
+### keypool.py
+### Pool of pre-generated random keys, so enciphering doesn't have to wait for key generation.
+### A background producer thread keeps a number of keys ready for each key size in use (up to a
+### limit on the bytes held ready; larger keys are generated when they are asked for), either
+### in memory or in a directory (one file per key). Each key is handed out exactly once:
+### on disk, a key is claimed by renaming its file, which only one consumer can do.
+### Requires that os.urandom() be available.
+
+import randchars,os,sys,threading;
+from vigenere import parseSize;
+from collections import deque;
+from itertools import count;
+
+# number of keys kept ready for each size
+DEPTH_DEF=4;
+# most bytes of keys kept ready in all (sizes that don't fit depth times aren't pooled at all)
+MAXBYTES_DEF=64*1024*1024;
+# suffix of ready key files
+READY_SUFFIX=".key";
+
+# usage
+def usage(sname):
+	print("Usage:",sname,"[--depth N] [--maxbytes SIZE] MODE DIR [SIZES]");
+
+# full fledged help
+def helpmsg(sname):
+	usage(sname);
+	print("    MODE     Can be 'fill', 'serve', 'status', or 'help'");
+	print("             'fill' tops up the pool once, 'serve' keeps it topped up until interrupted,");
+	print("             'status' shows how many keys are ready for each size");
+	print("    DIR      Directory holding the pool");
+	print("    SIZES    Comma-separated key sizes to keep keys ready for (required for 'fill' and 'serve')");
+	print("    --depth  Number of keys to keep ready for each size (default "+str(DEPTH_DEF)+")");
+	print("    --maxbytes  Most bytes of keys to keep ready in all, e.g. 256M (default "+str(MAXBYTES_DEF//1024//1024)+"M)");
+
+# Pool of ready keys, produced in the background
+class KeyPool:
+	def __init__(self,path=None,sizes=(),depth=DEPTH_DEF,maxbytes=MAXBYTES_DEF):
+		""" Make a key pool. Call start() to begin producing keys in the background.
+		:param path: Directory to keep keys in, or None to keep them in memory
+		:param sizes: Key sizes to keep keys ready for (sizes asked for with take() are added)
+		:param depth: Number of keys to keep ready for each size
+		:param maxbytes: Most bytes of keys to keep ready in all; keys of a size that doesn't fit
+		depth times are never kept ready, but generated when they are taken
+		"""
+		self.path=path;
+		self.sizes=set(sizes);
+		self.depth=depth;
+		self.maxbytes=maxbytes;
+		# in-memory keys, size -> deque of keys
+		self.keys={};
+		self.lock=threading.Lock();
+		# set when keys may need producing
+		self.wanted=threading.Event();
+		self.stopping=threading.Event();
+		self.thread=None;
+		# unique names for key files made or claimed by this process
+		self.serial=count();
+		if path is not None:
+			os.makedirs(path,mode=0o700,exist_ok=True);
+	# directory holding ready keys of a size
+	def sizeDir(self,size):
+		return os.path.join(self.path,str(size));
+	# number of keys ready for a size
+	def ready(self,size):
+		if self.path is None:
+			with self.lock:
+				return len(self.keys.get(size,()));
+		try:
+			return sum(1 for name in os.listdir(self.sizeDir(size)) if name.endswith(READY_SUFFIX));
+		except FileNotFoundError:
+			return 0;
+	# whether keys of a size are kept ready at all
+	def pooled(self,size):
+		return size>0 and size*self.depth<=self.maxbytes;
+	# bytes of keys ready, for every size
+	def readyBytes(self):
+		return sum(size*self.ready(size) for size in self.sizes);
+	# add one newly generated key of a size to the pool
+	def produce(self,size):
+		if self.path is None:
+			key=randchars.doRandChars(size);
+			with self.lock:
+				self.keys.setdefault(size,deque()).append(key);
+			return;
+		sdir=self.sizeDir(size);
+		os.makedirs(sdir,mode=0o700,exist_ok=True);
+		name="{0:d}-{1:d}-{2:d}".format(os.getpid(),threading.get_ident(),next(self.serial));
+		tmppath=os.path.join(sdir,name+".tmp");
+		# write under a temporary name and rename into place, so a key is never claimed half-written
+		with open(os.open(tmppath,os.O_WRONLY|os.O_CREAT|os.O_EXCL,0o600),"wb") as kfile:
+			randchars.writeRandChars(kfile,size);
+		os.rename(tmppath,os.path.join(sdir,name+READY_SUFFIX));
+	# top up every size to the pool's depth
+	def fill(self):
+		""" Generate keys until depth keys are ready for every size, or until maxbytes are ready in all
+		(smaller sizes are topped up first).
+		:return: Number of keys generated
+		"""
+		made=0;
+		for size in sorted(self.sizes):
+			if not self.pooled(size):
+				continue;
+			while not self.stopping.is_set() and self.ready(size)<self.depth and self.readyBytes()+size<=self.maxbytes:
+				self.produce(size);
+				made+=1;
+		return made;
+	# claim a ready key
+	def claim(self,size):
+		""" Take a ready key of the given size out of the pool.
+		:param size: Key size
+		:return: Key, or None if none is ready
+		"""
+		if self.path is None:
+			with self.lock:
+				keys=self.keys.get(size);
+				return (keys and keys.popleft() or None);
+		sdir=self.sizeDir(size);
+		try:
+			names=[name for name in os.listdir(sdir) if name.endswith(READY_SUFFIX)];
+		except FileNotFoundError:
+			return None;
+		for name in names:
+			claimpath=os.path.join(sdir,"claimed-{0:d}-{1:d}-{2:d}".format(os.getpid(),threading.get_ident(),next(self.serial)));
+			# only one consumer can rename a given file; anyone else gets FileNotFoundError and tries the next
+			try:
+				os.rename(os.path.join(sdir,name),claimpath);
+			except FileNotFoundError:
+				continue;
+			try:
+				with open(claimpath,"rb") as kfile:
+					key=kfile.read();
+			finally:
+				os.remove(claimpath);
+			if len(key)==size:
+				return key;
+		return None;
+	# get a key, from the pool if one is ready
+	def take(self,size):
+		""" Get a key that has never been handed out before, from the pool if one is ready,
+		otherwise by generating one now. Either way, the producer is asked to top the pool up,
+		unless keys of this size are too large to be kept ready (see pooled()).
+		:param size: Key size
+		:return: Key
+		"""
+		if not self.pooled(size):
+			return randchars.doRandChars(size);
+		self.sizes.add(size);
+		key=self.claim(size);
+		self.wanted.set();
+		if key is None:
+			key=randchars.doRandChars(size);
+		return key;
+	# producer thread
+	def run(self):
+		while not self.stopping.is_set():
+			self.wanted.clear();
+			self.fill();
+			self.wanted.wait();
+	# start producing keys in the background
+	def start(self):
+		self.thread=threading.Thread(target=self.run,name="keypool",daemon=True);
+		self.thread.start();
+		self.wanted.set();
+		return self;
+	# stop producing keys
+	def stop(self):
+		self.stopping.set();
+		self.wanted.set();
+		if self.thread:
+			self.thread.join();
+			self.thread=None;
+
+# command line mode, accept arguments
+def onCmdLine():
+	thisis=sys.argv[0];
+	args=sys.argv[:];
+	try:
+		depth=int(randchars.popOpt(args,"--depth",DEPTH_DEF));
+		maxbytes=parseSize(str(randchars.popOpt(args,"--maxbytes",MAXBYTES_DEF)));
+		sizes=[int(size) for size in (len(args)>=4 and args[3].split(",") or ())];
+		if depth<=0 or maxbytes<=0 or any(size<=0 for size in sizes):
+			raise ValueError("must be positive");
+	except ValueError:
+		usage(thisis);
+		print("Invalid depth, byte limit or key size");
+		exit(2);
+	mode=(len(args)>=2 and args[1] or None);
+	if mode=="help":
+		helpmsg(thisis);
+		exit(0);
+	if len(args)<3 or (mode in ("fill","serve") and not sizes):
+		usage(thisis);
+		print("Try '"+thisis+" help' for more information.");
+		exit(2);
+	pool=KeyPool(args[2],sizes,depth,maxbytes);
+	if mode=="fill":
+		print("Generated",pool.fill(),"key(s)");
+	elif mode=="serve":
+		# poll the directory, since consumers in other processes can't wake the producer
+		print("Keeping",depth,"key(s) ready for sizes",",".join(str(size) for size in sizes),"in",args[2],file=sys.stderr);
+		try:
+			while True:
+				pool.fill();
+				pool.stopping.wait(1);
+		except KeyboardInterrupt:
+			pass;
+	elif mode=="status":
+		try:
+			found=sorted(int(name) for name in os.listdir(args[2]) if name.isdigit());
+		except FileNotFoundError:
+			found=[];
+		for size in (sizes or found):
+			print(size,pool.ready(size));
+	else:
+		usage(thisis);
+		print("Invalid mode argument; can only be 'fill', 'serve', 'status', or 'help'");
+		exit(2);
+
+if __name__=="__main__":
+	onCmdLine();
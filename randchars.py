@@ -3,49 +3,173 @@
 ### randchars.py
 ### Generates random bytes and writes them to a file.
 ### Requires that os.urandom() be available.
+### Bytes are generated and written a buffer at a time, so memory use stays constant
+### however many are asked for.
+### With --seed, writes a reproducible test corpus instead: a seeded mix of random,
+### text-like and zero-filled regions, for benchmarking ciphering and compression.
 
 import os;
 import sys;
+from collections import deque;
+from random import Random;
+from concurrent.futures import ThreadPoolExecutor;
+from time import perf_counter;
+from vigenere import popOpt;
+
+# default number of bytes generated and written at a time
+BUFSIZE_DEF=1024*1024;
+# size of each region of a test corpus
+REGION_SIZE=64*1024;
+# default proportions of random, text-like and zero-filled regions in a test corpus
+MIX_DEF=(1,0,0);
+# size of the text that text-like regions are cut from
+TEXTPOOL_SIZE=1024*1024;
 
 # usage
 def usage(sname):
-	print("Usage:",sname,"NUMCHARS [OUTPUT]");
+	print("Usage:",sname,"[--bufsize N] [--threads N] NUMCHARS [OUTPUT]");
+	print("      ",sname,"--seed N [--mix R,T,Z] NUMCHARS [OUTPUT]");
 
 # full fledged help
 def helpmsg(sname):
 	usage(sname);
-	print("    NUMCHARS  Number of characters to generate");
-	print("    OUTPUT    Path to a file to write random characters to");
+	print("    NUMCHARS   Number of characters to generate");
+	print("    OUTPUT     Path to a file to write random characters to (default: raw bytes to stdout)");
+	print("    --bufsize  Number of bytes to generate and write at a time (default "+str(BUFSIZE_DEF)+")");
+	print("    --threads  Number of threads generating buffers in parallel (default 1)");
+	print("    --seed     Write a reproducible test corpus generated from this seed, instead of random bytes");
+	print("    --mix      Proportions of random, text-like and zero-filled regions in the corpus (default "+",".join(str(part) for part in MIX_DEF)+")");
 
 # generate random characters
 def doRandChars(howmany):
 	# return bytes from system random device
 	return bytes(os.urandom(howmany));
 
+# generate random characters a buffer at a time
+def genRandChunks(howmany,bufsize=BUFSIZE_DEF,threads=1):
+	""" Yield howmany random bytes, in chunks of at most bufsize bytes.
+	:param howmany: Number of bytes to generate
+	:param bufsize: Size of each chunk
+	:param threads: Number of threads generating chunks in parallel
+	:return: Generator of bytes objects
+	"""
+	sizes=(min(bufsize,howmany-pos) for pos in range(0,howmany,bufsize));
+	if threads<=1:
+		for size in sizes:
+			yield doRandChars(size);
+		return;
+	# keep a few chunks in flight per thread, so memory stays bounded
+	with ThreadPoolExecutor(threads) as pool:
+		pending=deque();
+		for size in sizes:
+			pending.append(pool.submit(doRandChars,size));
+			if len(pending)>=2*threads:
+				yield pending.popleft().result();
+		while pending:
+			yield pending.popleft().result();
+
+# make the text that text-like corpus regions are cut from
+def mkTextPool(rng):
+	# a vocabulary of made-up words, strung together in lines
+	vocab=["".join(rng.choices("etaoinshrdlucmfwypvbgkqjxz",k=rng.randint(1,10))) for i in range(2000)];
+	words=rng.choices(vocab,k=TEXTPOOL_SIZE//5);
+	for i in range(12,len(words),12):
+		words[i]+="\n";
+	text=" ".join(words).encode("ascii");
+	return (text*(TEXTPOOL_SIZE//len(text)+1))[:TEXTPOOL_SIZE];
+
+# generate a test corpus a region at a time
+def genCorpusChunks(howmany,seed,mix=MIX_DEF):
+	""" Yield a reproducible test corpus of howmany bytes, made of REGION_SIZE regions
+	that are each random, text-like or zero-filled. The same seed and mix always give the same bytes.
+	:param howmany: Number of bytes to generate
+	:param seed: Seed
+	:param mix: Proportions of random, text-like and zero-filled regions
+	:return: Generator of bytes objects
+	"""
+	if len(mix)!=3 or min(mix)<0 or sum(mix)<=0:
+		raise ValueError("invalid mix",mix);
+	rng=Random(seed);
+	textpool=(mix[1] and mkTextPool(rng) or b"");
+	zeros=bytes(REGION_SIZE);
+	for pos in range(0,howmany,REGION_SIZE):
+		size=min(REGION_SIZE,howmany-pos);
+		kind=rng.choices((0,1,2),weights=mix)[0];
+		if kind==0:
+			yield rng.randbytes(size);
+		elif kind==1:
+			start=rng.randrange(TEXTPOOL_SIZE-REGION_SIZE);
+			yield textpool[start:start+size];
+		else:
+			yield zeros[:size];
+
+# generate a whole test corpus
+def doCorpus(howmany,seed,mix=MIX_DEF):
+	return b"".join(genCorpusChunks(howmany,seed,mix));
+
+# write chunks to a file
+def writeChunks(ofile,chunks):
+	""" Write each of chunks to a binary file object.
+	:param ofile: File object to write to
+	:param chunks: Iterable of bytes objects
+	:return: Number of bytes written
+	"""
+	written=0;
+	for chunk in chunks:
+		ofile.write(chunk);
+		written+=len(chunk);
+	ofile.flush();
+	return written;
+
+# write random characters to a file
+def writeRandChars(ofile,howmany,bufsize=BUFSIZE_DEF,threads=1):
+	""" Write howmany random bytes to a binary file object.
+	:param ofile: File object to write to
+	:param howmany: Number of bytes to write
+	:param bufsize: Number of bytes to generate and write at a time
+	:param threads: Number of threads generating bytes in parallel
+	:return: Number of bytes written
+	"""
+	return writeChunks(ofile,genRandChunks(howmany,bufsize,threads));
+
 # command line mode, accept arguments
 def onCmdLine():
 	# name of this script
 	thisis=sys.argv[0];
+	args=sys.argv[:];
+	try:
+		bufsize=int(popOpt(args,"--bufsize",BUFSIZE_DEF));
+		threads=int(popOpt(args,"--threads",1));
+		seed=popOpt(args,"--seed");
+		if seed is not None:
+			seed=int(seed);
+		mix=tuple(float(part) for part in popOpt(args,"--mix",",".join(str(part) for part in MIX_DEF)).split(","));
+		if bufsize<=0 or threads<=0 or len(mix)!=3 or min(mix)<0 or sum(mix)<=0:
+			raise ValueError("must be positive");
+	except ValueError:
+		usage(thisis);
+		print("Invalid option value");
+		exit(2);
 	# path to file
 	fpath=None;
 	# whether to write a file
 	writeoutfile=True;
 	# if the user did not specify a file path, don't write a file
 	try:
-		fpath=sys.argv[2];
+		fpath=args[2];
 	except IndexError:
 		writeoutfile=False;
 	
 	# how many bytes to generate?
 	try:
-		howmany=int(sys.argv[1]);
+		howmany=int(args[1]);
 	except IndexError:
 		# user did not provide this argument
 		usage(thisis);
 		exit(2);
 	except ValueError:
 		# user typed 'help' or other invalid value
-		if sys.argv[1]=="help":
+		if args[1]=="help":
 			# user typed 'help'
 			helpmsg(thisis);
 			exit(0);
@@ -54,18 +178,25 @@ def onCmdLine():
 			print("First argument is not a number");
 			usage(thisis);
 			exit(2);
-	print("Writing",howmany,"random bytes to",(fpath or "stdout"));
-	# generate bytes
-	byteset=doRandChars(howmany);
-	# write out (to file if desired)
+	# report on stderr, so it doesn't get mixed up with bytes written to stdout
+	print("Writing",howmany,(seed is None and "random" or "test corpus"),"bytes to",(fpath or "stdout"),file=sys.stderr);
+	starttime=perf_counter();
+	if seed is None:
+		chunks=genRandChunks(howmany,bufsize,threads);
+	else:
+		chunks=genCorpusChunks(howmany,seed,mix);
+	# generate and write out (to file if desired)
 	if writeoutfile:
 		# write to file
-		ofile=open(fpath,"wb");
-		ofile.write(byteset);
-		ofile.close();
+		with open(fpath,"wb") as ofile:
+			written=writeChunks(ofile,chunks);
 	else:
-		# write to stdout
-		print(byteset);
+		# write raw bytes to stdout
+		written=writeChunks(sys.stdout.buffer,chunks);
+	tdelta=perf_counter()-starttime;
+	print("Wrote {0:d} bytes in {1:.3f} seconds ({2:.2f} MiB/s)".format(
+		written,tdelta,(tdelta>0 and written/tdelta/1024**2 or 0.0)
+	),file=sys.stderr);
 
 if __name__=="__main__":
 	onCmdLine();
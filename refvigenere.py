@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+### refvigenere.py
+### Frozen reference copy of the cipher core of vigenere.py (extTrimKey, doDataEncode,
+### doDataDecode and msgKeyPreprocess), exactly as they were before any optimisation.
+### conformance.py checks other engines against it; do not change anything here, as
+### every change to it is a change to the cipher itself.
+
+import zlib;
+from math import ceil;
+from hashlib import sha512;
+from random import seed,getrandbits,shuffle;
+from vigenere import ZeroKeyException;
+
+# size of blocks
+BLKSIZE=8192;
+
+# universal ctable start point (ints 0-255 in order)
+UCTABLE=tuple(n for n in range(256));
+
+# extend and trim a key, transforming each subsequent copy
+def extTrimKey(key,glen):
+	""" Preprocess a key for enciphering or deciphering; extend it to the length of the message,
+	pseudo-randomly transforming each part of the key
+	:param key: Key to process
+	:param glen: Length to make the final key
+	:return: The key, extended and trimmed to the desired length
+	"""
+	# key to be returned
+	keyfinal=b"";
+	# start with initial key value
+	keypart=key;
+	for i in range(ceil(glen/len(key))):
+		# transform this copy of the key
+		# hash last key part and seed random number generator
+		seed(sha512(keypart).digest());
+		# generate new key part
+		keypnum=getrandbits(len(keypart)*8);
+		# hex format random number to extract bytes
+		keyphex=("{0:0>"+str(len(keypart)*2)+"x}").format(keypnum);
+		# make key part
+		keypart=bytes.fromhex(keyphex);
+		# add it to existing key
+		keyfinal+=keypart;
+	# trim key to message length
+	keyfinal=keyfinal[:glen];
+	# return result
+	return keyfinal;
+
+# encipher a single byte (call for map())
+def doIntEncode(msgb,keyb,ctable):
+	return ctable[(msgb+keyb)%256];
+
+# decipher a single byte (call for map())
+def doIntDecode(msgb,keyb,rctable):
+	return (rctable[msgb]-keyb)%256;
+
+# encipher binary data string directly
+# message is no longer compressed by default
+# (or at all)
+def doDataEncode(msg,key,gz=False,skipextkey=False):
+	""" Encipher and return msg using the given key.
+	if gz is true, the message is zlib-compressed before being enciphered.
+	:param msg: Message to encipher
+	:param key: Key to encipher message with
+	:param gz: Whether message should be compressed before enciphering
+	:param skipextkey: Whether to not extend and trim the key received (for use by doEncodeWrite)
+	:return: Enciphered message
+	"""
+	# is key zero-length?
+	if len(key)<=0:
+		# if so, error
+		raise ZeroKeyException("zero-length key");
+	# compress message and measure length
+	if gz:
+		msg=zlib.compress(msg);
+	msglen=len(msg);
+	# seed RNG with hash of key
+	seed(sha512(key).digest());
+	# generate ctable mappings by shuffling ints 0-255 in pseudorandom order decided by key
+	thisctable=list(UCTABLE);
+	shuffle(thisctable);
+	# extend and trim key if specified
+	if not skipextkey:
+		key=extTrimKey(key,msglen);
+	# encipher message
+	# (now using doIntEncode() and a for loop, to allow passing of ctable)
+	encoded=b"";
+	for mb,kb in zip(msg,key):
+		encoded+=bytes([doIntEncode(mb,kb,thisctable)]);
+	# return enciphered message
+	return encoded;
+
+# decipher binary data string directly
+def doDataDecode(msg,key,gz=False,skipextkey=False):
+	""" Decipher and return msg using the given key.
+	If gz is True, it is assumed the resulting plaintext is zlib-compressed.
+	:param msg: Message to decipher
+	:param key: Key to decipher message with
+	:param gz: Whether deciphered message has been compressed
+	:param skipextkey: Whether to not extend and trim the key received (for use by doEncodeWrite)
+	:return: Deciphered message
+	"""
+	# is key zero-length?
+	if len(key)<=0:
+		# if so, error
+		raise ZeroKeyException("zero-length key");
+	# get message and length
+	msglen=len(msg);
+	# seed RNG with hash of key
+	seed(sha512(key).digest());
+	# generate ctable mappings by shuffling ints 0-255 in pseudorandom order decided by key
+	thisctableval=list(UCTABLE);
+	shuffle(thisctableval);
+	# zip original and shuffled ctable mappings
+	thisctable=dict(zip(thisctableval,UCTABLE));
+	# extend and trim key if specified
+	if not skipextkey:
+		key=extTrimKey(key,msglen);
+	# decipher message
+	# (now using doIntDecode() and a for loop, to allow passing of ctable)
+	decoded=b"";
+	for mb,kb in zip(msg,key):
+		decoded+=bytes([doIntDecode(mb,kb,thisctable)]);
+	# uncompress final message and return
+	try:
+		return (gz and bytes(zlib.decompress(decoded)) or decoded);
+	except zlib.error:
+		return None;
+
+# preprocess message and key for doEn/DecodeWrite()
+def msgKeyPreprocess(msg,key):
+	""" Do some preprocessing on the message and key
+	prior to their use in doEncodeWrite() or doDecodeWrite().
+	:param msg: Message to preprocess
+	:param key: Key to preprocess
+	:return: List of message blocks, list of key blocks
+	"""
+	# break message and key into 8k blocks; extend the key each round
+	msgblks=[];
+	keyblks=[];
+	# start with the key itself
+	thiskeyblk=key;
+	# iterate over range of indexes (start at block size, increment by block size each block)
+	for i in range(BLKSIZE,len(msg)+BLKSIZE,BLKSIZE):
+		# append a block of message data
+		msgblks.append(msg[i-BLKSIZE:i]);
+		# extend and transform a block of key data
+		thiskeyblk=extTrimKey(thiskeyblk[len(thiskeyblk)-len(key):],BLKSIZE);
+		# append the block of transformed key data
+		keyblks.append(thiskeyblk);
+	# return blocks
+	return msgblks,keyblks;
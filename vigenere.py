@@ -47,23 +47,115 @@
 ###    5.5. The plaintext block is written to the destination file.
 ### 6. The destination file is closed.
 
-import os,zlib;
+import os,sys,zlib,json,mmap,queue,shutil,tempfile,threading,platform,tracemalloc;
+from contextlib import ExitStack;
 from math import ceil;
 from hashlib import sha512;
-from random import seed,getrandbits,shuffle;
+from random import Random;
 from time import perf_counter;
+from datetime import datetime;
+from collections import namedtuple,deque;
+from concurrent.futures import ProcessPoolExecutor;
+from multiprocessing import shared_memory;
+from itertools import islice,chain;
+try:
+	import resource;
+except ImportError:
+	# not on Windows; peak RSS just isn't reported there
+	resource=None;
 
 # size of blocks
 BLKSIZE=8192;
+# size of the buffers files are read into when en/deciphering them (a whole number of blocks and pages)
+PIPE_BUFSIZE=128*BLKSIZE;
+# number of buffers read ahead of, and written behind, the block being en/deciphered
+PIPE_DEPTH=2;
+# ways of handing buffers to worker processes: pickled through a pipe, or through shared memory
+ENGINES=("pickle","shm");
+ENGINE_DEF="shm";
+# settings a tuning profile may set (none of them change the output)
+PROFILE_KEYS=("workers","engine","bufsize");
+# smallest buffers a memory budget shrinks them to before taking buffers out of flight (see _fitBudget())
+MEMBUDGET_MINBUF=16*BLKSIZE;
 
 # universal ctable start point (ints 0-255 in order)
 UCTABLE=tuple(n for n in range(256));
+# the same, as bytes, for building translation tables by rotating it
+UCBYTES=bytes(UCTABLE);
+# smallest and largest number of same-key records encodeMany()/decodeMany() process a column at a time
+MANY_MIN=8;
+MANY_MAX=1024;
+
+# progress report passed to the progress callbacks of encodeFile() and decodeFile():
+# fraction done, blocks done, number of blocks, bytes done, number of bytes,
+# throughput in bytes per second, and estimated seconds remaining
+Progress=namedtuple("Progress",("amtdone","curblk","totalblks","bytesdone","totalbytes","rate","eta"));
 
 # exceptions
 # zero length key
 class ZeroKeyException(Exception): pass;
 # zero length value (such as a file path)
 class ZeroValException(Exception): pass;
+# en/deciphering was cancelled before it finished
+class CancelledException(Exception): pass;
+
+# per-stage timing and throughput counters
+class Stats:
+	""" Cumulative timers and byte counters for each stage of enciphering or deciphering.
+	Pass an instance as the stats argument of doEncodeWrite(), doDecodeWrite(), doDataEncode(),
+	doDataDecode() or msgKeyPreprocess() to have it filled in as the work is done.
+	"""
+	# stages that are timed
+	STAGES=("read","keysched","table","subst","compress","write");
+	def __init__(self):
+		# seconds spent in each stage
+		self.times=dict.fromkeys(self.STAGES,0.0);
+		# bytes handled by each stage
+		self.bytes=dict.fromkeys(self.STAGES,0);
+		# wall clock time of the whole run
+		self.total=0.0;
+		# memory budget, the settings it allowed and the peaks seen (see noteMemory())
+		self.memory={};
+	def add(self,stage,secs,nbytes=0):
+		""" Add time spent and bytes handled to a stage's counters.
+		:param stage: Name of the stage, one of STAGES
+		:param secs: Seconds spent in the stage
+		:param nbytes: Number of bytes handled by the stage
+		"""
+		self.times[stage]+=secs;
+		self.bytes[stage]+=nbytes;
+	def noteMemory(self,**figures):
+		""" Record the given memory figures, along with the peak resident set size of this process and
+		of its finished child processes, and the peak of memory traced by tracemalloc since the run
+		started, if it is tracing (start Python with -X tracemalloc to have it traced).
+		:param figures: Figures to record, such as the budget and the buffer size it allowed
+		"""
+		self.memory.update(figures);
+		if resource:
+			# ru_maxrss is in KiB, except on macOS, where it is in bytes
+			scale=(sys.platform=="darwin" and 1 or 1024);
+			self.memory["peak_rss"]=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*scale;
+			self.memory["peak_rss_children"]=resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss*scale;
+		if tracemalloc.is_tracing():
+			self.memory["tracemalloc_peak"]=max(self.memory.get("tracemalloc_peak",0),tracemalloc.get_traced_memory()[1]);
+	def asDict(self):
+		""" Return the counters as a dictionary, with the throughput of each stage in bytes per second.
+		:return: Dictionary of counters
+		"""
+		stages={};
+		for stage in self.STAGES:
+			secs=self.times[stage];
+			stages[stage]={
+				"seconds":secs,
+				"bytes":self.bytes[stage],
+				"bytes_per_sec":(secs>0 and self.bytes[stage]/secs or 0.0)
+			};
+		return {"total_seconds":self.total,"stages":stages,"memory":dict(self.memory)};
+	def asJson(self):
+		""" Return the counters as a JSON string (see asDict()).
+		:return: JSON string
+		"""
+		return json.dumps(self.asDict(),indent=1);
 
 # extend and trim a key, transforming each subsequent copy
 def extTrimKey(key,glen):
@@ -80,9 +172,10 @@ def extTrimKey(key,glen):
 	for i in range(ceil(glen/len(key))):
 		# transform this copy of the key
 		# hash last key part and seed random number generator
-		seed(sha512(keypart).digest());
+		# (a generator of our own rather than the random module's shared one, so threads can't disturb it)
+		rng=Random(sha512(keypart).digest());
 		# generate new key part
-		keypnum=getrandbits(len(keypart)*8);
+		keypnum=rng.getrandbits(len(keypart)*8);
 		# hex format random number to extract bytes
 		keyphex=("{0:0>"+str(len(keypart)*2)+"x}").format(keypnum);
 		# make key part
@@ -119,13 +212,14 @@ def doIntDecode(msgb,keyb,rctable):
 # encipher binary data string directly
 # message is no longer compressed by default
 # (or at all)
-def doDataEncode(msg,key,gz=False,skipextkey=False):
+def doDataEncode(msg,key,gz=False,skipextkey=False,stats=None):
 	""" Encipher and return msg using the given key.
 	if gz is true, the message is zlib-compressed before being enciphered.
 	:param msg: Message to encipher
 	:param key: Key to encipher message with
 	:param gz: Whether message should be compressed before enciphering
 	:param skipextkey: Whether to not extend and trim the key received (for use by doEncodeWrite)
+	:param stats: Stats object to add timings to, if any
 	:return: Enciphered message
 	"""
 	# is key zero-length?
@@ -134,32 +228,43 @@ def doDataEncode(msg,key,gz=False,skipextkey=False):
 		raise ZeroKeyException("zero-length key");
 	# compress message and measure length
 	if gz:
+		stagestart=perf_counter();
 		msg=zlib.compress(msg);
+		if stats:
+			stats.add("compress",perf_counter()-stagestart,len(msg));
 	msglen=len(msg);
+	stagestart=perf_counter();
 	# seed RNG with hash of key
-	seed(sha512(key).digest());
+	rng=Random(sha512(key).digest());
 	# generate ctable mappings by shuffling ints 0-255 in pseudorandom order decided by key
 	thisctable=list(UCTABLE);
-	shuffle(thisctable);
+	rng.shuffle(thisctable);
+	if stats:
+		stats.add("table",perf_counter()-stagestart);
 	# extend and trim key if specified
 	if not skipextkey:
+		stagestart=perf_counter();
 		key=extTrimKey(key,msglen);
+		if stats:
+			stats.add("keysched",perf_counter()-stagestart,msglen);
 	# encipher message
 	# (now using doIntEncode() and a for loop, to allow passing of ctable)
-	encoded=b"";
-	for mb,kb in zip(msg,key):
-		encoded+=bytes([doIntEncode(mb,kb,thisctable)]);
+	stagestart=perf_counter();
+	encoded=bytes(doIntEncode(mb,kb,thisctable) for mb,kb in zip(msg,key));
+	if stats:
+		stats.add("subst",perf_counter()-stagestart,msglen);
 	# return enciphered message
 	return encoded;
 
 # decipher binary data string directly
-def doDataDecode(msg,key,gz=False,skipextkey=False):
+def doDataDecode(msg,key,gz=False,skipextkey=False,stats=None):
 	""" Decipher and return msg using the given key.
 	If gz is True, it is assumed the resulting plaintext is zlib-compressed.
 	:param msg: Message to decipher
 	:param key: Key to decipher message with
 	:param gz: Whether deciphered message has been compressed
 	:param skipextkey: Whether to not extend and trim the key received (for use by doEncodeWrite)
+	:param stats: Stats object to add timings to, if any
 	:return: Deciphered message
 	"""
 	# is key zero-length?
@@ -168,141 +273,842 @@ def doDataDecode(msg,key,gz=False,skipextkey=False):
 		raise ZeroKeyException("zero-length key");
 	# get message and length
 	msglen=len(msg);
+	stagestart=perf_counter();
 	# seed RNG with hash of key
-	seed(sha512(key).digest());
+	rng=Random(sha512(key).digest());
 	# generate ctable mappings by shuffling ints 0-255 in pseudorandom order decided by key
 	thisctableval=list(UCTABLE);
-	shuffle(thisctableval);
+	rng.shuffle(thisctableval);
 	# zip original and shuffled ctable mappings
 	thisctable=dict(zip(thisctableval,UCTABLE));
+	if stats:
+		stats.add("table",perf_counter()-stagestart);
 	# extend and trim key if specified
 	if not skipextkey:
+		stagestart=perf_counter();
 		key=extTrimKey(key,msglen);
+		if stats:
+			stats.add("keysched",perf_counter()-stagestart,msglen);
 	# decipher message
 	# (now using doIntDecode() and a for loop, to allow passing of ctable)
-	decoded=b"";
-	for mb,kb in zip(msg,key):
-		decoded+=bytes([doIntDecode(mb,kb,thisctable)]);
+	stagestart=perf_counter();
+	decoded=bytes(doIntDecode(mb,kb,thisctable) for mb,kb in zip(msg,key));
+	if stats:
+		stats.add("subst",perf_counter()-stagestart,msglen);
+	# return now if there is nothing to uncompress
+	if not gz:
+		return decoded;
 	# uncompress final message and return
+	stagestart=perf_counter();
 	try:
-		return (gz and bytes(zlib.decompress(decoded)) or decoded);
+		plain=bytes(zlib.decompress(decoded));
 	except zlib.error:
 		return None;
+	if stats:
+		stats.add("compress",perf_counter()-stagestart,len(plain));
+	# (an empty result falls back to the data as it was before uncompressing, as it always has)
+	return (plain or decoded);
+
+# en/decipher many records, grouped by key (shared by encodeMany() and decodeMany())
+def _doDataMany(pairs,gz,decode,stats):
+	""" En/decipher each (message, key) pair as doDataEncode()/doDataDecode() would, but set up the
+	substitution table and extended key only once per distinct key. Records sharing a key are
+	padded to a common length and en/deciphered a column (key position) at a time, each column
+	being a single bytes.translate() over every record.
+	:param pairs: Sequence of (message, key) pairs
+	:param gz: Whether messages are (to be) compressed
+	:param decode: Whether to decipher rather than encipher
+	:param stats: Stats object to add timings to, if any
+	:return: List of results, in the same order as pairs
+	"""
+	msgs=[];
+	# key -> length bucket -> indexes of records (buckets keep padding to under half of each record)
+	groups={};
+	for idx,(msg,key) in enumerate(pairs):
+		if len(key)<=0:
+			raise ZeroKeyException("zero-length key");
+		if gz and not decode:
+			stagestart=perf_counter();
+			msg=zlib.compress(msg);
+			if stats:
+				stats.add("compress",perf_counter()-stagestart,len(msg));
+		msgs.append(msg);
+		groups.setdefault(bytes(key),{}).setdefault(len(msg).bit_length(),[]).append(idx);
+	results=[None]*len(msgs);
+	for key,buckets in groups.items():
+		# substitution table, as for doDataEncode()/doDataDecode()
+		stagestart=perf_counter();
+		rng=Random(sha512(key).digest());
+		thisctable=list(UCTABLE);
+		rng.shuffle(thisctable);
+		if decode:
+			# reverse table, as bytes
+			revtable=bytearray(256);
+			for pos,val in enumerate(thisctable):
+				revtable[val]=pos;
+			tblbytes=bytes(revtable);
+		else:
+			tblbytes=bytes(thisctable);
+		# translation table for each key byte, made as needed
+		kbtables={};
+		if stats:
+			stats.add("table",perf_counter()-stagestart);
+		# one extended key serves every record, since a shorter extension is always a prefix of a longer one
+		maxlen=max(len(msgs[idx]) for idxs in buckets.values() for idx in idxs);
+		stagestart=perf_counter();
+		fullkey=extTrimKey(key,maxlen);
+		if stats:
+			stats.add("keysched",perf_counter()-stagestart,maxlen);
+		stagestart=perf_counter();
+		nbytes=0;
+		# (batches of at most MANY_MAX records, so each column stays in cache)
+		batches=[idxs[i:i+MANY_MAX] for idxs in buckets.values() for i in range(0,len(idxs),MANY_MAX)];
+		for idxs in batches:
+			if len(idxs)<MANY_MIN:
+				# too few records to be worth transposing
+				for idx in idxs:
+					if decode:
+						results[idx]=bytes(tblbytes[cb]-kb&255 for cb,kb in zip(msgs[idx],fullkey));
+					else:
+						results[idx]=bytes(tblbytes[mb+kb&255] for mb,kb in zip(msgs[idx],fullkey));
+					nbytes+=len(msgs[idx]);
+				continue;
+			# pad the records to the same length, one after another, so column i is every buflen'th byte from i
+			buflen=max(len(msgs[idx]) for idx in idxs);
+			padded=b"".join(msgs[idx].ljust(buflen,b"\0") for idx in idxs);
+			out=bytearray(len(padded));
+			for i in range(buflen):
+				kb=fullkey[i];
+				if kb not in kbtables:
+					if decode:
+						# (table[c]-kb)%256: the reverse table, then subtract kb
+						kbtables[kb]=tblbytes.translate(UCBYTES[-kb%256:]+UCBYTES[:-kb%256]);
+					else:
+						# table[(m+kb)%256]: the table rotated left by kb
+						kbtables[kb]=tblbytes[kb:]+tblbytes[:kb];
+				out[i::buflen]=padded[i::buflen].translate(kbtables[kb]);
+			for n,idx in enumerate(idxs):
+				results[idx]=bytes(out[n*buflen:n*buflen+len(msgs[idx])]);
+			nbytes+=len(padded);
+		if stats:
+			stats.add("subst",perf_counter()-stagestart,nbytes);
+	# uncompress deciphered records, as doDataDecode() does
+	if gz and decode:
+		stagestart=perf_counter();
+		for idx,decoded in enumerate(results):
+			try:
+				plain=bytes(zlib.decompress(decoded));
+			except zlib.error:
+				results[idx]=None;
+				continue;
+			results[idx]=(plain or decoded);
+		if stats:
+			stats.add("compress",perf_counter()-stagestart,sum(len(res) for res in results if res));
+	return results;
+
+# encipher many records
+def encodeMany(pairs,gz=False,stats=None):
+	""" Encipher many records at once; the result for each is the same as doDataEncode(msg,key,gz) would return.
+	Much faster than calling doDataEncode() for each when records are small and keys are shared.
+	:param pairs: Sequence of (message, key) pairs
+	:param gz: Whether messages should be compressed before enciphering
+	:param stats: Stats object to add timings to, if any
+	:return: List of enciphered messages, in the same order as pairs
+	"""
+	return _doDataMany(pairs,gz,False,stats);
+
+# decipher many records
+def decodeMany(pairs,gz=False,stats=None):
+	""" Decipher many records at once; the result for each is the same as doDataDecode(msg,key,gz) would return.
+	Much faster than calling doDataDecode() for each when records are small and keys are shared.
+	:param pairs: Sequence of (message, key) pairs
+	:param gz: Whether deciphered messages have been compressed
+	:param stats: Stats object to add timings to, if any
+	:return: List of deciphered messages, in the same order as pairs
+	"""
+	return _doDataMany(pairs,gz,True,stats);
+
+# generate the key blocks used to en/decipher each message block
+def genKeyBlocks(key,prev=None):
+	""" Extend and transform a key one block at a time, as msgKeyPreprocess() does.
+	:param key: Key to extend
+	:param prev: Key block to carry on from (such as the last one yielded by an earlier call), if any
+	:return: Yields key blocks of BLKSIZE bytes indefinitely
+	"""
+	# start with the key itself, or where we left off
+	thiskeyblk=(prev or key);
+	while True:
+		# extend and transform a block of key data
+		thiskeyblk=extTrimKey(thiskeyblk[len(thiskeyblk)-len(key):],BLKSIZE);
+		yield thiskeyblk;
 
 # preprocess message and key for doEn/DecodeWrite()
-def msgKeyPreprocess(msg,key):
+def msgKeyPreprocess(msg,key,stats=None):
 	""" Do some preprocessing on the message and key
 	prior to their use in doEncodeWrite() or doDecodeWrite().
 	:param msg: Message to preprocess
 	:param key: Key to preprocess
+	:param stats: Stats object to add key schedule timings to, if any
 	:return: List of message blocks, list of key blocks
 	"""
 	# break message and key into 8k blocks; extend the key each round
 	msgblks=[];
 	keyblks=[];
-	# start with the key itself
-	thiskeyblk=key;
+	# key blocks, each extended and transformed from the last
+	keysched=genKeyBlocks(key);
+	stagestart=perf_counter();
 	# iterate over range of indexes (start at block size, increment by block size each block)
 	for i in range(BLKSIZE,len(msg)+BLKSIZE,BLKSIZE):
 		# append a block of message data
 		msgblks.append(msg[i-BLKSIZE:i]);
-		# extend and transform a block of key data
-		thiskeyblk=extTrimKey(thiskeyblk[len(thiskeyblk)-len(key):],BLKSIZE);
-		# append the block of transformed key data
-		keyblks.append(thiskeyblk);
+		# append the next block of transformed key data
+		keyblks.append(next(keysched));
+	if stats:
+		stats.add("keysched",perf_counter()-stagestart,len(keyblks)*BLKSIZE);
 	# return blocks
 	return msgblks,keyblks;
 
-# encipher file and write out to other file
-def doEncodeWrite(ipath,opath,key,gz=False):
-	""" Encipher the file at ipath using the given key, and write the results to the file at opath.
-	:param ipath: Path to file to encipher
-	:param opath: Path to write enciphered file to
-	:param key: Key to encipher file with
-	:param gz: Whether to compress received message before enciphering it
-	:return: Yields its progress as a float, int, and int
+# path of the tuning profile
+def profilePath():
+	return os.environ.get("VIGENERE_PROFILE") or os.path.join(os.path.expanduser("~"),".vigenere_profile.json");
+
+# tuning profile, once loaded
+_profile=None;
+
+# load the tuning profile
+def loadProfile(ppath=None):
+	""" Load the settings saved by saveProfile() (see 'bench_vigenere.py tune') for this host.
+	A profile saved on another host, or with settings that don't make sense, is ignored.
+	:param ppath: Path to the profile (default: profilePath(), and the result is kept for next time)
+	:return: Dictionary of any of PROFILE_KEYS
+	"""
+	global _profile;
+	if ppath is None and _profile is not None:
+		return _profile;
+	try:
+		with open(ppath or profilePath()) as pfile:
+			prof=json.load(pfile);
+	except (OSError,ValueError):
+		prof={};
+	settings={};
+	if isinstance(prof,dict) and prof.get("host")==platform.node():
+		if isinstance(prof.get("workers"),int) and prof["workers"]>=1:
+			settings["workers"]=prof["workers"];
+		if prof.get("engine") in ENGINES:
+			settings["engine"]=prof["engine"];
+		if isinstance(prof.get("bufsize"),int) and prof["bufsize"]>0 and prof["bufsize"]%BLKSIZE==0:
+			settings["bufsize"]=prof["bufsize"];
+	if ppath is None:
+		_profile=settings;
+	return settings;
+
+# save a tuning profile
+def saveProfile(settings,results=None,ppath=None):
+	""" Save settings for this host, to be used by default by encodeFile(), doEncodeWrite() and the like.
+	:param settings: Dictionary of any of PROFILE_KEYS
+	:param results: Measurements the settings were chosen from, kept in the profile for reference
+	:param ppath: Path to the profile (default: profilePath())
+	"""
+	global _profile;
+	prof={"host":platform.node(),"cpus":os.cpu_count(),"date":datetime.now().isoformat(),"blksize":BLKSIZE};
+	prof.update((key,settings[key]) for key in PROFILE_KEYS if key in settings);
+	if results is not None:
+		prof["results"]=results;
+	with open(ppath or profilePath(),"w") as pfile:
+		json.dump(prof,pfile,indent=1);
+	_profile=None;
+
+# fill in settings not given from the tuning profile
+def tunedSettings(workers=None,engine=None,bufsize=None):
+	""" Return the number of worker processes, engine and buffer size to use, taking any not given
+	from the tuning profile, or the defaults if there is none. The buffer size is rounded up to a
+	whole number of blocks.
+	:return: Tuple of workers, engine, bufsize
+	"""
+	prof=loadProfile();
+	bufsize=(bufsize or prof.get("bufsize",PIPE_BUFSIZE));
+	return (workers or prof.get("workers",1)),(engine or prof.get("engine",ENGINE_DEF)),max(1,-(-bufsize//BLKSIZE))*BLKSIZE;
+
+# memory taken by _doCodeWriteMulti()'s buffers
+def _pipeMemory(bufsize,depth,inflight,ntargets,nscheds,copies):
+	""" Estimate the memory taken by the buffers of _doCodeWriteMulti(): those read ahead, each target's
+	output queued to be written, and for each buffer being processed (or in flight in worker processes)
+	its data, key blocks and output.
+	:param bufsize: Size of the buffers
+	:param depth: Number of buffers read ahead and queued for each writer
+	:param inflight: Number of buffers in flight in worker processes (0 without them)
+	:param ntargets: Number of targets
+	:param nscheds: Number of key schedules per target
+	:param copies: Number of copies of each buffer in flight (2 when pickled to workers, since they hold their own)
+	:return: Number of bytes
+	"""
+	return bufsize*((depth+1)*(1+ntargets)+(inflight+1)*(1+ntargets*(nscheds+1))*copies);
+
+# fit _doCodeWriteMulti()'s buffers into a memory budget
+def _fitBudget(membudget,bufsize,depth,inflight,ntargets,nscheds,copies):
+	""" Shrink the buffers, then the number of them in flight, then the queues until _pipeMemory() fits
+	membudget: first the buffers down to MEMBUDGET_MINBUF, then the buffers in flight down to one,
+	then the queues down to one buffer, then the buffers down to one block. If the budget can't be
+	met even then, the smallest settings are used.
+	:param membudget: Number of bytes the buffers may take, or None for no limit
+	:return: Tuple of bufsize, depth, inflight, and the number of bytes they are estimated to take
+	"""
+	def estimate():
+		return _pipeMemory(bufsize,depth,inflight,ntargets,nscheds,copies);
+	while membudget and estimate()>membudget:
+		if bufsize>MEMBUDGET_MINBUF:
+			bufsize=max(MEMBUDGET_MINBUF,bufsize//2//BLKSIZE*BLKSIZE);
+		elif inflight>1:
+			inflight-=1;
+		elif depth>1:
+			depth-=1;
+		elif bufsize>BLKSIZE:
+			bufsize=max(BLKSIZE,bufsize//2//BLKSIZE*BLKSIZE);
+		else:
+			break;
+	return bufsize,depth,inflight,estimate();
+
+# read a file into reused buffers on a thread of its own (the first stage of _doCodeWrite())
+def _readStage(ifile,freebufs,filled,stats,stop,length):
+	try:
+		while True:
+			buf=freebufs.get();
+			if buf is None or stop.is_set():
+				return;
+			# fill the whole buffer (a read may return less than asked for before the end of the file),
+			# so that blocks never straddle two buffers
+			view=memoryview(buf);
+			want=min(len(buf),length);
+			nbytes=0;
+			stagestart=perf_counter();
+			while nbytes<want:
+				got=ifile.readinto(view[nbytes:want]);
+				if not got:
+					break;
+				nbytes+=got;
+			view.release();
+			length-=nbytes;
+			stats.add("read",perf_counter()-stagestart,nbytes);
+			filled.put((buf,nbytes,None));
+			if nbytes<len(buf):
+				return;
+	except Exception as exc:
+		filled.put((None,0,exc));
+
+# write en/deciphered data out on a thread of its own (the last stage of _doCodeWrite())
+def _writeStage(ofile,outbufs,stats,errors):
+	while True:
+		data=outbufs.get();
+		if data is None:
+			return;
+		# after an error, keep taking data so the compute stage doesn't block, but stop writing
+		if errors:
+			continue;
+		try:
+			stagestart=perf_counter();
+			ofile.write(data);
+			stats.add("write",perf_counter()-stagestart,len(data));
+		except Exception as exc:
+			errors.append(exc);
+
+# encipher or decipher file block by block (shared by doEncodeWrite() and doDecodeWrite())
+def _doCodeWrite(ipath,opath,key,gz,stats,decode,keysched=None,span=None,workers=None,engine=None,bufsize=None,membudget=None):
+	""" Encipher or decipher the file at ipath using the given key, and write the results to the file at opath.
+	:param ipath: Path to file to en/decipher
+	:param opath: Path to write en/deciphered file to
+	:param key: Key to en/decipher file with
+	:param gz: Whether the message is (to be) compressed
+	:param stats: Stats object to fill in
+	:param decode: Whether to decipher rather than encipher
+	:param keysched: Iterable of key blocks to use instead of deriving them from key, if any
+	:param span: Offset and length of the part of the file to en/decipher, if not all of it
+	:param workers: Number of processes to en/decipher blocks in parallel
+	:param engine: How to hand blocks to the worker processes, one of ENGINES
+	:param bufsize: Size of the buffers the file is read into, a whole number of blocks
+	:param membudget: Number of bytes the buffers may take (see _fitBudget())
+	:return: Yields the number of blocks done, the number of blocks, the number of bytes done,
+	and the number of bytes after every block
+	"""
+	if keysched is None:
+		if len(key)<=0:
+			raise ZeroKeyException("zero-length key");
+		keysched=genKeyBlocks(key);
+	return _doCodeWriteMulti(ipath,[(opath,[keysched])],gz,stats,(decode and "decode" or "encode"),workers,span,engine,bufsize,membudget);
+
+# en/decipher or re-key a buffer's worth of blocks (run in a worker process when there are several)
+def _codeChunk(op,chunk,keyblks,gz,stats=None):
+	""" En/decipher or re-key each block of chunk.
+	:param op: 'encode', 'decode' or 'rekey'
+	:param chunk: Data to process, a whole number of blocks except perhaps at the end of the file
+	:param keyblks: List of tuples of key blocks for each block: (key block,) to en/decipher,
+	(old key block, new key block) to re-key
+	:param gz: Whether the message is (to be) compressed
+	:param stats: Stats object to add timings to, if any
+	:return: Processed data
+	"""
+	out=[];
+	for i,kblks in enumerate(keyblks):
+		blk=chunk[i*BLKSIZE:(i+1)*BLKSIZE];
+		if op=="encode":
+			out.append(doDataEncode(blk,kblks[0],gz,skipextkey=True,stats=stats));
+		elif op=="decode":
+			out.append(doDataDecode(blk,kblks[0],gz,skipextkey=True,stats=stats));
+		else:
+			# decipher under the old key and encipher under the new one, without the plaintext leaving memory
+			plain=doDataDecode(blk,kblks[0],gz,skipextkey=True,stats=stats);
+			out.append(doDataEncode(plain,kblks[1],gz,skipextkey=True,stats=stats));
+	return b"".join(out);
+
+# shared memory segments attached to by this worker process, by name
+_shmcache={};
+
+# en/decipher or re-key a buffer's worth of blocks held in shared memory (run in a worker process)
+def _codeChunkShm(op,shmname,nbytes,ntargets,nscheds,bufsize):
+	""" Do _codeChunk() on data and key blocks in a shared memory slot, writing the output into the slot.
+	The slot holds bufsize bytes of input, then for each target bufsize bytes of key blocks
+	for each of its key schedules followed by bufsize bytes for its output.
+	:param op: 'encode', 'decode' or 'rekey'
+	:param shmname: Name of the shared memory slot
+	:param nbytes: Number of bytes of input
+	:param ntargets: Number of targets
+	:param nscheds: Number of key schedules per target
+	:param bufsize: Size of each part of the slot
+	"""
+	if shmname not in _shmcache:
+		_shmcache[shmname]=shared_memory.SharedMemory(shmname);
+	view=_shmcache[shmname].buf;
+	chunk=view[:nbytes];
+	nblks=ceil(nbytes/BLKSIZE);
+	pos=bufsize;
+	for target in range(ntargets):
+		scheds=[view[pos+i*bufsize:pos+i*bufsize+nblks*BLKSIZE] for i in range(nscheds)];
+		pos+=nscheds*bufsize;
+		keyblks=[tuple(sched[i*BLKSIZE:(i+1)*BLKSIZE] for sched in scheds) for i in range(nblks)];
+		view[pos:pos+nbytes]=_codeChunk(op,chunk,keyblks,False);
+		pos+=bufsize;
+
+# derive the first block of a key schedule ahead of time
+def _primeKeyBlocks(keysched):
+	keysched=iter(keysched);
+	first=next(keysched,None);
+	return (first is None and keysched or chain((first,),keysched));
+
+# whether two paths name the same existing file
+def _sameFile(path1,path2):
+	try:
+		return os.path.samefile(path1,path2);
+	except OSError:
+		return False;
+
+# make an empty temporary file in the same directory as a path, so it can be moved over it
+def _tempPathBeside(path):
+	tmpfd,tmppath=tempfile.mkstemp(prefix="."+os.path.basename(path)+".",suffix=".tmp",dir=(os.path.dirname(path) or "."));
+	os.close(tmpfd);
+	return tmppath;
+
+# encipher, decipher or re-key file block by block, for any number of outputs at once
+def _doCodeWriteMulti(ipath,targets,gz,stats,op,workers=None,span=None,engine=None,bufsize=None,membudget=None):
+	""" En/decipher or re-key the file at ipath once for each target, writing each result to its own file.
+	The file is only read once. Reading and each output's writing are done on threads of their own,
+	through a few reused buffers, so the disks are kept busy while blocks are being processed.
+	:param ipath: Path to file to process
+	:param targets: List of (path to write to, list of iterables of key blocks); one iterable to
+	en/decipher, the old key's and the new key's to re-key
+	:param gz: Whether the message is (to be) compressed
+	:param stats: Stats object to fill in
+	:param op: 'encode', 'decode' or 'rekey'
+	:param workers: Number of processes to en/decipher buffers in parallel; key blocks are still derived
+	in order in this process, since each depends on the last (default: from the tuning profile, or 1)
+	:param span: Offset and length of the part of the file to process, if not all of it
+	:param engine: How to hand buffers to worker processes, one of ENGINES; 'shm' falls back to 'pickle'
+	when compressing, since output is then not the same size as input (default: from the tuning profile, or ENGINE_DEF)
+	:param bufsize: Size of the buffers, a whole number of blocks (default: from the tuning profile, or PIPE_BUFSIZE)
+	:param membudget: Number of bytes the buffers may take; the buffers, the queues and the number of buffers
+	in flight in worker processes are shrunk to fit (see _fitBudget()), and the settings used and the peak
+	memory use are recorded in stats
+	:return: Yields the number of blocks done, the number of blocks, the number of bytes done,
+	and the number of bytes after every block
 	"""
 	# start timer
 	starttime=perf_counter();
-	# get message and length
-	msg=getMsg(ipath);
+	workers,engine,bufsize=tunedSettings(workers,engine,bufsize);
+	# check the message exists and get its length
+	if not os.access(ipath,os.F_OK):
+		raise FileNotFoundError("file not found",ipath);
 	# perform check for zero length output file path
 	# (zero length input path will get caught when
 	# trying to read the file)
-	if len(ipath)<=0 or len(opath)<=0:
+	if len(ipath)<=0 or not targets or any(len(opath)<=0 for opath,keyscheds in targets):
 		raise ZeroValException("empty output file field");
-	# preprocess message and key
-	msgblks,keyblks=msgKeyPreprocess(msg,key);
+	# key blocks for each output, derived as they are needed (bar the first, derived now, so that a key
+	# that can't be used fails before any output is opened and emptied)
+	targets=[(opath,[_primeKeyBlocks(keysched) for keysched in keyscheds]) for opath,keyscheds in targets];
+	nscheds=len(targets[0][1]);
+	# fit the buffers into the memory budget, keeping a couple of buffers per worker in flight if it allows
+	useshm=(workers>1 and engine=="shm" and not gz);
+	bufsize,depth,inflight,estimate=_fitBudget(
+		membudget,bufsize,PIPE_DEPTH,(workers>1 and 2*workers or 0),len(targets),nscheds,(workers>1 and not useshm and 2 or 1)
+	);
+	workers=min(workers,max(inflight,1));
+	inflight=(workers>1 and inflight or 0);
+	if tracemalloc.is_tracing():
+		tracemalloc.reset_peak();
+	stats.noteMemory(budget=membudget,estimate=estimate,bufsize=bufsize,depth=depth,inflight=inflight);
+	# buffers shared by the stages: free ones, ones filled by the reader, and output for each writer
+	freebufs=queue.Queue();
+	filled=queue.Queue();
+	outbufs=[queue.Queue(depth) for target in targets];
+	stop=threading.Event();
+	errors=[];
+	bufs=[mmap.mmap(-1,bufsize) for i in range(depth+1)];
+	for buf in bufs:
+		freebufs.put(buf);
+	# an output that is the input itself (en/deciphering in place) is written to a temporary file beside it
+	# and moved over it at the end, since opening it for writing would empty the input before it is read
+	tmppaths=[(_sameFile(ipath,opath) and _tempPathBeside(opath) or None) for opath,keyscheds in targets];
+	# outputs this run creates, to be removed again if it fails
+	created=[not os.path.exists(opath) for opath,keyscheds in targets];
+	try:
+		with ExitStack() as files:
+			ifile=files.enter_context(open(ipath,"rb",buffering=0));
+			ofiles=[
+				files.enter_context(open((tmppath or opath),(op=="decode" and "wb+" or "wb")))
+				for (opath,keyscheds),tmppath in zip(targets,tmppaths)
+			];
+			filesize=os.fstat(ifile.fileno()).st_size;
+			offset,totalbytes=(span or (0,filesize));
+			totalbytes=max(0,min(totalbytes,filesize-offset));
+			totalblks=ceil(totalbytes/BLKSIZE);
+			ifile.seek(offset);
+			# tell the kernel we'll read the file from start to end, so it reads ahead further
+			if hasattr(os,"posix_fadvise"):
+				os.posix_fadvise(ifile.fileno(),offset,totalbytes,os.POSIX_FADV_SEQUENTIAL);
+			reader=threading.Thread(target=_readStage,args=(ifile,freebufs,filled,stats,stop,totalbytes),name="vigenere-read",daemon=True);
+			writers=[
+				threading.Thread(target=_writeStage,args=(ofile,outq,stats,errors),name="vigenere-write",daemon=True)
+				for ofile,outq in zip(ofiles,outbufs)
+			];
+			reader.start();
+			for writer in writers:
+				writer.start();
+			pool=(workers>1 and ProcessPoolExecutor(workers) or None);
+			# buffers being processed: (output for each target, or futures for it, number of bytes, shared memory slot)
+			pending=deque();
+			# shared memory slots for the buffers in flight, laid out as _codeChunkShm() expects
+			slots=[];
+			if pool and useshm:
+				slots=[shared_memory.SharedMemory(create=True,size=bufsize*(1+len(targets)*(nscheds+1))) for i in range(inflight+1)];
+			freeslots=deque(slots);
+			try:
+				curblk=0;
+				bytesdone=0;
+				while True:
+					buf,nbytes,exc=filled.get();
+					if exc:
+						raise exc;
+					# derive the key blocks for this buffer, for each target
+					nblks=ceil(nbytes/BLKSIZE);
+					stagestart=perf_counter();
+					keyblks=[list(zip(*[islice(keysched,nblks) for keysched in keyscheds])) for opath,keyscheds in targets];
+					stats.add("keysched",perf_counter()-stagestart,nblks*BLKSIZE*sum(len(keyscheds) for opath,keyscheds in targets));
+					# en/decode one 8k block at a time, here or in the worker processes
+					if slots:
+						# copy the data and key blocks into a free slot, and pass the workers only its name
+						slot=freeslots.popleft();
+						slot.buf[:nbytes]=memoryview(buf)[:nbytes];
+						freebufs.put(buf);
+						pos=bufsize;
+						for kblks in keyblks:
+							for sched in range(nscheds):
+								slot.buf[pos:pos+nblks*BLKSIZE]=b"".join(kblk[sched] for kblk in kblks);
+								pos+=bufsize;
+							pos+=bufsize;
+						pending.append(([pool.submit(_codeChunkShm,op,slot.name,nbytes,len(targets),nscheds,bufsize)],nbytes,slot));
+					else:
+						# copy the data out, and hand the buffer straight back to the reader
+						chunk=buf[:nbytes];
+						freebufs.put(buf);
+						if pool:
+							pending.append(([pool.submit(_codeChunk,op,chunk,kblks,gz) for kblks in keyblks],nbytes,None));
+						else:
+							pending.append(([_codeChunk(op,chunk,kblks,gz,stats) for kblks in keyblks],nbytes,None));
+					# pass finished buffers on to the writers, keeping up to inflight of them in the workers
+					eof=(nbytes<bufsize);
+					while pending and (eof or len(pending)>inflight):
+						outs,donebytes,slot=pending.popleft();
+						if pool:
+							stagestart=perf_counter();
+							outs=[fut.result() for fut in outs];
+							if slot:
+								# copy each target's output out of the slot, and free it
+								outs=[
+									bytes(slot.buf[(target+1)*(nscheds+1)*bufsize:(target+1)*(nscheds+1)*bufsize+donebytes])
+									for target in range(len(targets))
+								];
+								freeslots.append(slot);
+							# (only the time spent waiting for the workers can be seen from here)
+							stats.add("subst",perf_counter()-stagestart,donebytes*len(outs));
+						if errors:
+							raise errors[0];
+						for outq,out in zip(outbufs,outs):
+							outq.put(out);
+						for i in range(0,donebytes,BLKSIZE):
+							curblk+=1;
+							bytesdone+=min(BLKSIZE,donebytes-i);
+							yield curblk,totalblks,bytesdone,totalbytes;
+					if eof:
+						break;
+			finally:
+				if pool:
+					pool.shutdown(cancel_futures=True);
+				for slot in slots:
+					slot.close();
+					slot.unlink();
+				# stop the threads, letting the writers finish what they have been given
+				stop.set();
+				freebufs.put(None);
+				for outq in outbufs:
+					outq.put(None);
+				reader.join();
+				for writer in writers:
+					writer.join();
+				for buf in bufs:
+					buf.close();
+			if errors:
+				raise errors[0];
+	except BaseException:
+		for (opath,keyscheds),tmppath,new in zip(targets,tmppaths,created):
+			if tmppath and os.path.exists(tmppath):
+				os.remove(tmppath);
+			elif new and os.path.exists(opath):
+				os.remove(opath);
+		raise;
+	for (opath,keyscheds),tmppath in zip(targets,tmppaths):
+		if tmppath:
+			shutil.copymode(opath,tmppath);
+			os.replace(tmppath,opath);
+	# get time it took to en/decipher, and the peak memory use
+	tdelta=perf_counter()-starttime;
+	stats.total+=tdelta;
+	stats.noteMemory();
+	print("[{0: >8.8f}] [VIGENERE] {1} took {2:.8f} seconds.".format(perf_counter(),{"encode":"Enciphering","decode":"Deciphering","rekey":"Re-keying"}[op],tdelta));
+
+# thin out _doCodeWrite()'s per-block status into the status messages yielded by doEncodeWrite() and doDecodeWrite()
+def _yieldStatus(blkgen):
 	# determine how often to show status messages (typically, for longer texts, 20 will be shown in total)
-	blkstathowoften=len(msgblks)//20;
-	if blkstathowoften<=0:
-		blkstathowoften=1;
-	# encode and write message one 8k block at a time
-	ofile=open(opath,"wb");
-	for it,blk in enumerate(msgblks):
-		# encipher a single block
-		blkenc=doDataEncode(blk,keyblks[it],gz,skipextkey=True);
-		# write block to file
-		ofile.write(blkenc);
+	blkstathowoften=None;
+	totalblks=0;
+	for curblk,totalblks,bytesdone,totalbytes in blkgen:
+		if blkstathowoften is None:
+			blkstathowoften=max(totalblks//20,1);
 		# yield status at each specified interval
+		it=curblk-1;
 		if it%blkstathowoften==0:
-			# how much have we done? (%)
-			amtdone=it/len(msgblks);
-			# yield that percentage, the current block index, and the number of blocks
-			yield amtdone,it,len(msgblks);
+			# yield the percentage done, the current block index, and the number of blocks
+			yield it/totalblks,it,totalblks;
 	# we are finished, one more status message indicating 100% completion for good measure
-	yield 1,len(msgblks),len(msgblks);
-	# print("[VIGENERE] 100.00% done (block {0:d} of {0:d})".format(len(msgblks)));
-	# get time it took to encipher
-	completiontime=perf_counter();
-	tdelta=completiontime-starttime;
-	ofile.close();
-	print("[{0: >8.8f}] [VIGENERE] Enciphering took {1:.8f} seconds.".format(perf_counter(),tdelta));
+	yield 1,totalblks,totalblks;
+
+# encipher file and write out to other file
+def doEncodeWrite(ipath,opath,key,gz=False,stats=None,membudget=None):
+	""" Encipher the file at ipath using the given key, and write the results to the file at opath.
+	:param ipath: Path to file to encipher
+	:param opath: Path to write enciphered file to
+	:param key: Key to encipher file with
+	:param gz: Whether to compress received message before enciphering it
+	:param stats: Stats object to fill in; a new one is made if not given
+	:param membudget: Number of bytes the buffers may take, to keep memory use down on shared hosts
+	:return: Yields its progress as a float, int, and int; returns the Stats object when finished
+	"""
+	if stats is None:
+		stats=Stats();
+	yield from _yieldStatus(_doCodeWrite(ipath,opath,key,gz,stats,decode=False,membudget=membudget));
+	return stats;
 
 # decipher file and write to other file
-def doDecodeWrite(ipath,opath,key,gz=False):
+def doDecodeWrite(ipath,opath,key,gz=False,stats=None,membudget=None):
 	""" Decipher the file at ipath using the given key, and write the results to the file at opath.
 	:param ipath: Path to file to decipher
 	:param opath: Path to write deciphered file to
 	:param key: Key to decipher file with
 	:param gz: Whether the received message was compressed prior to enciphering
-	:return: Yields its progress as a float, int, and int
+	:param stats: Stats object to fill in; a new one is made if not given
+	:param membudget: Number of bytes the buffers may take, to keep memory use down on shared hosts
+	:return: Yields its progress as a float, int, and int; returns the Stats object when finished
 	"""
-	# start timer
+	if stats is None:
+		stats=Stats();
+	yield from _yieldStatus(_doCodeWrite(ipath,opath,key,gz,stats,decode=True,membudget=membudget));
+	return stats;
+
+# run _doCodeWrite() to completion, reporting progress through a callback
+def _runCodeWrite(blkgen,progress,interval,cancel,ipath,opaths):
 	starttime=perf_counter();
-	# get message and length
-	msg=getMsg(ipath);
-	# perform check for zero length output file path
-	# (zero length input path will get caught when
-	# trying to read the file)
-	if len(ipath)<=0 or len(opath)<=0:
-		raise ZeroValException("empty output file field");
-	# preprocess message and key
-	msgblks,keyblks=msgKeyPreprocess(msg,key);
-	# determine how often to show status messages (20 will be shown in total)
-	blkstathowoften=len(msgblks)//20;
-	if blkstathowoften<=0:
-		blkstathowoften=1;
-	# decode and write message one 8k block at a time
-	ofile=open(opath,"wb+");
-	for it,blk in enumerate(msgblks):
-		# decipher a single block
-		blkdec=doDataDecode(blk,keyblks[it],gz,skipextkey=True);
-		# write block to file
-		ofile.write(blkdec);
-		# yield status at each specified interval
-		if it%blkstathowoften==0:
-			# how much have we done? (%)
-			amtdone=it/len(msgblks);
-			# yield that percentage, the current block index, and the number of blocks
-			yield amtdone,it,len(msgblks);
-	# we are finished, one more status message indicating 100% completion for good measure
-	yield 1,len(msgblks),len(msgblks);
-	# get time it took to decipher
-	completiontime=perf_counter();
-	tdelta=completiontime-starttime;
-	ofile.close();
-	print("[{0: >8.8f}] [VIGENERE] Deciphering took {1:.8f} seconds.".format(perf_counter(),tdelta));
+	lastreport=starttime;
+	for curblk,totalblks,bytesdone,totalbytes in blkgen:
+		# stop at this block boundary if asked to, removing the incomplete output
+		# (but not an output that is the input, which is only replaced once it is complete)
+		if cancel and cancel.is_set() and curblk<totalblks:
+			blkgen.close();
+			for opath in opaths:
+				if not _sameFile(ipath,opath) and os.path.exists(opath):
+					os.remove(opath);
+			raise CancelledException("cancelled",*opaths);
+		if not progress:
+			continue;
+		# only report once every interval seconds, and always report the last block
+		now=perf_counter();
+		if now-lastreport<interval and curblk<totalblks:
+			continue;
+		lastreport=now;
+		# work out throughput and time remaining
+		elapsed=now-starttime;
+		rate=(elapsed>0 and bytesdone/elapsed or 0.0);
+		eta=(rate>0 and (totalbytes-bytesdone)/rate or 0.0);
+		progress(Progress(curblk/totalblks,curblk,totalblks,bytesdone,totalbytes,rate,eta));
+
+# encipher file and write out to other file, without yielding status messages
+def encodeFile(ipath,opath,key,gz=False,stats=None,progress=None,interval=0.5,keysched=None,cancel=None,span=None,workers=None,engine=None,bufsize=None,membudget=None):
+	""" Encipher the file at ipath using the given key, and write the results to the file at opath.
+	Unlike doEncodeWrite(), this is not a generator; it returns once the file has been enciphered.
+	:param ipath: Path to file to encipher
+	:param opath: Path to write enciphered file to
+	:param key: Key to encipher file with
+	:param gz: Whether to compress received message before enciphering it
+	:param stats: Stats object to fill in; a new one is made if not given
+	:param progress: Function to call with a Progress object as the file is enciphered, if any
+	:param interval: Minimum number of seconds between calls to progress
+	:param keysched: Iterable of key blocks to use instead of deriving them from key (see genKeyBlocks()), if any
+	:param cancel: Object whose is_set() method returns True to stop at the next block boundary
+	(such as a threading.Event), if any; CancelledException is then raised and the output removed
+	:param span: Offset and length of the part of the file to encipher, if not all of it
+	(the offset should be a whole number of blocks, with keysched carrying on from the block before it)
+	:param workers: Number of processes to en/decipher blocks in parallel (default: from the tuning profile, or 1)
+	:param engine: How to hand blocks to the worker processes, one of ENGINES (default: from the tuning profile, or ENGINE_DEF)
+	:param bufsize: Size of the buffers the file is read into, a whole number of blocks (default: from the tuning profile, or PIPE_BUFSIZE)
+	:param membudget: Number of bytes the buffers may take, to keep memory use down on shared hosts
+	:return: The Stats object
+	"""
+	if stats is None:
+		stats=Stats();
+	blkgen=_doCodeWrite(ipath,opath,key,gz,stats,False,keysched,span,workers,engine,bufsize,membudget);
+	_runCodeWrite(blkgen,progress,interval,cancel,ipath,[opath]);
+	return stats;
+
+# decipher file and write to other file, without yielding status messages
+def decodeFile(ipath,opath,key,gz=False,stats=None,progress=None,interval=0.5,keysched=None,cancel=None,span=None,workers=None,engine=None,bufsize=None,membudget=None):
+	""" Decipher the file at ipath using the given key, and write the results to the file at opath.
+	Unlike doDecodeWrite(), this is not a generator; it returns once the file has been deciphered.
+	:param ipath: Path to file to decipher
+	:param opath: Path to write deciphered file to
+	:param key: Key to decipher file with
+	:param gz: Whether the received message was compressed prior to enciphering
+	:param stats: Stats object to fill in; a new one is made if not given
+	:param progress: Function to call with a Progress object as the file is deciphered, if any
+	:param interval: Minimum number of seconds between calls to progress
+	:param keysched: Iterable of key blocks to use instead of deriving them from key (see genKeyBlocks()), if any
+	:param cancel: Object whose is_set() method returns True to stop at the next block boundary
+	(such as a threading.Event), if any; CancelledException is then raised and the output removed
+	:param span: Offset and length of the part of the file to decipher, if not all of it
+	(the offset should be a whole number of blocks, with keysched carrying on from the block before it)
+	:param workers: Number of processes to en/decipher blocks in parallel (default: from the tuning profile, or 1)
+	:param engine: How to hand blocks to the worker processes, one of ENGINES (default: from the tuning profile, or ENGINE_DEF)
+	:param bufsize: Size of the buffers the file is read into, a whole number of blocks (default: from the tuning profile, or PIPE_BUFSIZE)
+	:param membudget: Number of bytes the buffers may take, to keep memory use down on shared hosts
+	:return: The Stats object
+	"""
+	if stats is None:
+		stats=Stats();
+	blkgen=_doCodeWrite(ipath,opath,key,gz,stats,True,keysched,span,workers,engine,bufsize,membudget);
+	_runCodeWrite(blkgen,progress,interval,cancel,ipath,[opath]);
+	return stats;
+
+# encipher a file under several keys, reading it only once
+def encodeFileMulti(ipath,targets,gz=False,stats=None,progress=None,interval=0.5,cancel=None,workers=None,engine=None,bufsize=None,membudget=None):
+	""" Encipher the file at ipath under each of several keys, writing each result to its own file.
+	The output for each key is the same as encodeFile() would write, but the file is only read once,
+	and the outputs are written at the same time.
+	:param ipath: Path to file to encipher
+	:param targets: List of (path to write enciphered file to, key to encipher it with)
+	:param gz: Whether to compress received message before enciphering it
+	:param stats: Stats object to fill in; a new one is made if not given
+	:param progress: Function to call with a Progress object as the file is enciphered, if any
+	:param interval: Minimum number of seconds between calls to progress
+	:param cancel: Object whose is_set() method returns True to stop at the next block boundary
+	(such as a threading.Event), if any; CancelledException is then raised and every output removed
+	:param workers: Number of processes to encipher blocks in parallel (default: from the tuning profile, or 1)
+	:param engine: How to hand blocks to the worker processes, one of ENGINES (default: from the tuning profile, or ENGINE_DEF)
+	:param bufsize: Size of the buffers the file is read into, a whole number of blocks (default: from the tuning profile, or PIPE_BUFSIZE)
+	:param membudget: Number of bytes the buffers may take, to keep memory use down on shared hosts
+	:return: The Stats object
+	"""
+	if stats is None:
+		stats=Stats();
+	if any(len(key)<=0 for opath,key in targets):
+		raise ZeroKeyException("zero-length key");
+	blkgen=_doCodeWriteMulti(ipath,[(opath,[genKeyBlocks(key)]) for opath,key in targets],gz,stats,"encode",workers,engine=engine,bufsize=bufsize,membudget=membudget);
+	_runCodeWrite(blkgen,progress,interval,cancel,ipath,[opath for opath,key in targets]);
+	return stats;
+
+# re-key an enciphered file
+def rekeyFile(ipath,opath,oldkey,newkey,gz=False,stats=None,progress=None,interval=0.5,cancel=None,workers=None,engine=None,bufsize=None,membudget=None):
+	""" Re-encipher the file at ipath, enciphered with oldkey, under newkey, and write the results to the file at opath.
+	Each block is deciphered and enciphered again in memory, so the plaintext is never written out.
+	The result is the same as deciphering with decodeFile() and enciphering with encodeFile().
+	:param ipath: Path to file to re-key
+	:param opath: Path to write re-keyed file to
+	:param oldkey: Key the file is enciphered with
+	:param newkey: Key to encipher the file with
+	:param gz: Whether the message was compressed prior to enciphering
+	:param stats: Stats object to fill in; a new one is made if not given
+	:param progress: Function to call with a Progress object as the file is re-keyed, if any
+	:param interval: Minimum number of seconds between calls to progress
+	:param cancel: Object whose is_set() method returns True to stop at the next block boundary
+	(such as a threading.Event), if any; CancelledException is then raised and the output removed
+	:param workers: Number of processes to re-key blocks in parallel (default: from the tuning profile, or 1)
+	:param engine: How to hand blocks to the worker processes, one of ENGINES (default: from the tuning profile, or ENGINE_DEF)
+	:param bufsize: Size of the buffers the file is read into, a whole number of blocks (default: from the tuning profile, or PIPE_BUFSIZE)
+	:param membudget: Number of bytes the buffers may take, to keep memory use down on shared hosts
+	:return: The Stats object
+	"""
+	if stats is None:
+		stats=Stats();
+	if len(oldkey)<=0 or len(newkey)<=0:
+		raise ZeroKeyException("zero-length key");
+	blkgen=_doCodeWriteMulti(ipath,[(opath,[genKeyBlocks(oldkey),genKeyBlocks(newkey)])],gz,stats,"rekey",workers,engine=engine,bufsize=bufsize,membudget=membudget);
+	_runCodeWrite(blkgen,progress,interval,cancel,ipath,[opath]);
+	return stats;
+
+# turn a size such as '64K' into a number of bytes
+def parseSize(sizestr):
+	""" Parse a size with an optional K, M or G (binary) suffix, for use by the frontends.
+	:param sizestr: Size to parse
+	:return: Number of bytes
+	:raise ValueError: If sizestr is not a size
+	"""
+	mults={"K":1024,"M":1024**2,"G":1024**3};
+	sizestr=sizestr.strip().upper();
+	if sizestr and sizestr[-1] in mults:
+		return int(sizestr[:-1])*mults[sizestr[-1]];
+	return int(sizestr);
+
+# remove an option and its value from a frontend's argument list
+def popOpt(args,opt,default=None):
+	""" Remove '--opt VALUE' from a list of command line arguments, for use by the frontends.
+	:param args: List of arguments (modified in place)
+	:param opt: Option to look for, including the leading dashes
+	:param default: Value to return if the option is not present
+	:return: Value given for the option, or default
+	:raise ValueError: If the option is given without a value
+	"""
+	if opt not in args:
+		return default;
+	idx=args.index(opt);
+	if idx+1>=len(args):
+		raise ValueError("option requires a value",opt);
+	val=args[idx+1];
+	del args[idx:idx+2];
+	return val;
 
 # the user may have attempted to run this directly, so display a warning if they did
 if __name__=="__main__":
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+
+### vigenere_d.py
+### Long-lived local cipher daemon. Keeps a pool of warm worker processes, each caching
+### loaded key files and derived key blocks, and accepts encipher/decipher/verify requests
+### over a Unix domain socket. vigenere_dc.py is the matching client.
+###
+### Protocol: each message in either direction is a frame made of a 4-byte big-endian
+### length followed by that many bytes of UTF-8 JSON. A request looks like
+###     {"op":"encipher","input":PATH,"output":PATH,"keyfile":PATH,"gz":false,"stats":false,"membudget":null}
+### where op is 'encipher', 'decipher', 'verify' (decipher INPUT and check it matches OUTPUT),
+### 'ping' or 'shutdown', and membudget, if not null, limits the bytes the file buffers may take
+### (see vigenere.encodeFile()). Paths should be absolute. The reply is {"ok":true} (with "stats"
+### if asked for, and "match" for 'verify') or {"ok":false,"error":NAME,"args":[...]}.
+
+import vigenere,os,sys,stat,json,struct,signal,socket,socketserver,tempfile,filecmp;
+import multiprocessing,threading;
+from collections import OrderedDict;
+from hashlib import sha512;
+from time import perf_counter;
+
+# largest frame accepted
+FRAME_MAX=1024*1024;
+# number of key files each worker keeps loaded
+KEYCACHE_MAX=64;
+# bytes of derived key blocks each worker keeps
+SCHEDCACHE_MAX=64*1024*1024;
+
+# directory for the socket when there is no $XDG_RUNTIME_DIR, private to this user
+def privateDir():
+	return os.path.join(tempfile.gettempdir(),"vigenere-"+str(os.getuid()));
+
+# default path to the daemon's socket, in a directory no other user can get into
+# (a predictable path in a shared directory could be taken by another user first)
+def defSocketPath():
+	return os.environ.get("VIGENERE_SOCKET") or os.path.join(os.environ.get("XDG_RUNTIME_DIR") or privateDir(),"vigenere.sock");
+
+# make privateDir(), or check it is still this user's alone
+def makePrivateDir():
+	""" Make the directory returned by privateDir(), readable and writable by this user only.
+	:return: Path to the directory
+	:raise OSError: If it already exists but is not a directory owned by and private to this user
+	"""
+	dirpath=privateDir();
+	try:
+		os.mkdir(dirpath,0o700);
+	except FileExistsError:
+		pass;
+	dirstat=os.lstat(dirpath);
+	if not stat.S_ISDIR(dirstat.st_mode) or dirstat.st_uid!=os.getuid() or dirstat.st_mode&0o077:
+		raise OSError("socket directory is not private to this user: "+dirpath);
+	return dirpath;
+
+# usage
+def usage(sname):
+	print("Usage:",sname,"[--socket PATH] [--workers N]");
+
+# full fledged help
+def helpmsg(sname):
+	usage(sname);
+	print("    --socket   Path to listen on (default $VIGENERE_SOCKET, or "+defSocketPath()+")");
+	print("    --workers  Number of worker processes (default: number of CPUs)");
+
+### framing ###
+
+# read exactly n bytes from a socket
+def recvExactly(sock,nbytes):
+	data=b"";
+	while len(data)<nbytes:
+		chunk=sock.recv(nbytes-len(data));
+		if not chunk:
+			raise ConnectionError("connection closed mid-frame");
+		data+=chunk;
+	return data;
+
+# send one frame
+def sendFrame(sock,obj):
+	""" Send obj as a JSON frame.
+	:param sock: Connected socket
+	:param obj: Object to send
+	"""
+	data=json.dumps(obj).encode("utf-8");
+	sock.sendall(struct.pack(">I",len(data))+data);
+
+# receive one frame
+def recvFrame(sock):
+	""" Receive a JSON frame.
+	:param sock: Connected socket
+	:return: Object received, or None if the connection was closed before a frame started
+	"""
+	head=sock.recv(4,socket.MSG_WAITALL);
+	if not head:
+		return None;
+	if len(head)<4:
+		head+=recvExactly(sock,4-len(head));
+	(nbytes,)=struct.unpack(">I",head);
+	if nbytes>FRAME_MAX:
+		raise ValueError("frame too large",nbytes);
+	return json.loads(recvExactly(sock,nbytes).decode("utf-8"));
+
+### worker processes ###
+
+# key files loaded by this worker: (path, mtime, size) -> key
+_keycache=OrderedDict();
+# key blocks derived by this worker: key hash -> list of key blocks
+_schedcache=OrderedDict();
+# bytes held in _schedcache
+_schedcachesize=0;
+
+# load a key file, from the cache if it has not changed
+def loadKey(keypath):
+	try:
+		keystat=os.stat(keypath);
+	except FileNotFoundError:
+		raise Exception("no such keyfile",keypath);
+	cachekey=(keypath,keystat.st_mtime_ns,keystat.st_size);
+	if cachekey in _keycache:
+		_keycache.move_to_end(cachekey);
+		return _keycache[cachekey];
+	key=vigenere.getMsg(keypath);
+	_keycache[cachekey]=key;
+	while len(_keycache)>KEYCACHE_MAX:
+		_keycache.popitem(last=False);
+	return key;
+
+# yield key blocks for a key, reusing and extending those derived earlier
+def cachedKeyBlocks(key):
+	global _schedcachesize;
+	keyhash=sha512(key).digest();
+	blks=_schedcache.setdefault(keyhash,[]);
+	_schedcache.move_to_end(keyhash);
+	yield from list(blks);
+	# carry on from the last cached block, caching new ones while there is room
+	for blk in vigenere.genKeyBlocks(key,(blks and blks[-1] or None)):
+		if _schedcachesize+len(blk)<=SCHEDCACHE_MAX and keyhash in _schedcache:
+			blks.append(blk);
+			_schedcachesize+=len(blk);
+		yield blk;
+
+# make room in the derived key cache before a job, dropping the least recently used keys
+def trimSchedCache(needed):
+	global _schedcachesize;
+	while _schedcache and _schedcachesize+needed>SCHEDCACHE_MAX:
+		keyhash,blks=_schedcache.popitem(last=False);
+		_schedcachesize-=sum(len(blk) for blk in blks);
+
+# run one request in a worker process
+def doJob(op,inpath,outpath,keypath,gz,wantstats,membudget=None):
+	""" En/decipher or verify a file, as vigenere_kf.doMain() would.
+	:param op: 'encipher', 'decipher' or 'verify'
+	:param inpath: Path to file to en/decipher
+	:param outpath: Path to write to (or, for 'verify', the expected plaintext)
+	:param keypath: Path to key file
+	:param gz: Whether the message is (to be) compressed
+	:param wantstats: Whether to return stats
+	:param membudget: Number of bytes the file buffers may take, if limited
+	:return: Reply to send to the client
+	"""
+	# check existence of files
+	if not os.access(inpath,os.F_OK):
+		raise Exception("no such plaintext",inpath);
+	key=loadKey(keypath);
+	if len(key)<=0:
+		raise vigenere.ZeroKeyException("zero-length key");
+	trimSchedCache(os.path.getsize(inpath));
+	stats=vigenere.Stats();
+	reply={"ok":True};
+	# (pool workers can't start processes of their own, so this one does all the work itself)
+	if op=="encipher":
+		vigenere.encodeFile(inpath,outpath,key,gz,stats,keysched=cachedKeyBlocks(key),workers=1,membudget=membudget);
+	elif op=="decipher":
+		vigenere.decodeFile(inpath,outpath,key,gz,stats,keysched=cachedKeyBlocks(key),workers=1,membudget=membudget);
+	elif op=="verify":
+		# decipher to a temporary file and compare it with the expected plaintext
+		tmpfd,tmppath=tempfile.mkstemp();
+		os.close(tmpfd);
+		try:
+			vigenere.decodeFile(inpath,tmppath,key,gz,stats,keysched=cachedKeyBlocks(key),workers=1,membudget=membudget);
+			reply["match"]=filecmp.cmp(tmppath,outpath,shallow=False);
+		finally:
+			os.remove(tmppath);
+	else:
+		raise Exception("no such mode",op);
+	if wantstats:
+		reply["stats"]=stats.asDict();
+	return reply;
+
+# ignore ^C in workers; the daemon shuts them down itself
+def initWorker():
+	signal.signal(signal.SIGINT,signal.SIG_IGN);
+
+### daemon ###
+
+# handles one client connection
+class RequestHandler(socketserver.BaseRequestHandler):
+	def handle(self):
+		while True:
+			try:
+				req=recvFrame(self.request);
+			except (ConnectionError,ValueError):
+				return;
+			if req is None:
+				return;
+			op=req.get("op");
+			if op=="ping":
+				sendFrame(self.request,{"ok":True});
+				continue;
+			if op=="shutdown":
+				sendFrame(self.request,{"ok":True});
+				self.server.shutdownLater();
+				return;
+			try:
+				reply=self.server.pool.apply(doJob,(
+					op,req.get("input",""),req.get("output",""),req.get("keyfile",""),
+					bool(req.get("gz",False)),bool(req.get("stats",False)),
+					(isinstance(req.get("membudget"),int) and req["membudget"] or None)
+				));
+			except Exception as exc:
+				reply={"ok":False,"error":type(exc).__name__,"args":[str(arg) for arg in exc.args]};
+			sendFrame(self.request,reply);
+
+# the daemon: a threaded Unix socket server in front of a process pool
+class CipherDaemon(socketserver.ThreadingMixIn,socketserver.UnixStreamServer):
+	daemon_threads=True;
+	def __init__(self,sockpath,workers=None):
+		# remove a stale socket left by a daemon that did not exit cleanly
+		if os.path.exists(sockpath):
+			probe=socket.socket(socket.AF_UNIX,socket.SOCK_STREAM);
+			try:
+				probe.connect(sockpath);
+				raise OSError("daemon already running",sockpath);
+			except (ConnectionRefusedError,FileNotFoundError):
+				os.remove(sockpath);
+			finally:
+				probe.close();
+		socketserver.UnixStreamServer.__init__(self,sockpath,RequestHandler);
+		os.chmod(sockpath,0o600);
+		self.sockpath=sockpath;
+		self.pool=multiprocessing.Pool(workers,initWorker);
+	def shutdownLater(self):
+		# shutdown() waits for serve_forever() to return, so it can't be called from a handler thread directly
+		threading.Thread(target=self.shutdown).start();
+	def server_close(self):
+		socketserver.UnixStreamServer.server_close(self);
+		self.pool.terminate();
+		self.pool.join();
+		if os.path.exists(self.sockpath):
+			os.remove(self.sockpath);
+
+# command line mode, accept arguments
+def onCmdLine():
+	thisis=sys.argv[0];
+	args=sys.argv[:];
+	if "help" in args[1:]:
+		helpmsg(thisis);
+		exit(0);
+	try:
+		sockpath=vigenere.popOpt(args,"--socket",defSocketPath());
+	except ValueError:
+		usage(thisis);
+		exit(2);
+	try:
+		workers=vigenere.popOpt(args,"--workers");
+		if workers is not None and int(workers)<1:
+			raise ValueError("must be at least 1");
+		workers=(workers and int(workers) or None);
+	except ValueError:
+		usage(thisis);
+		print("Invalid number of workers; must be a whole number, at least 1");
+		exit(2);
+	try:
+		if os.path.dirname(sockpath)==privateDir():
+			makePrivateDir();
+		server=CipherDaemon(sockpath,workers);
+	except OSError as exc:
+		print("Cannot listen on",sockpath+":",str(exc));
+		exit(1);
+	# shut down cleanly on SIGTERM as well as ^C
+	signal.signal(signal.SIGTERM,lambda signum,frame: server.shutdownLater());
+	print("[{0: >8.8f}] [VIGENERE] Daemon listening on {1}".format(perf_counter(),sockpath),file=sys.stderr);
+	try:
+		server.serve_forever();
+	except KeyboardInterrupt:
+		pass;
+	finally:
+		server.server_close();
+	print("[{0: >8.8f}] [VIGENERE] Daemon exiting.".format(perf_counter()),file=sys.stderr);
+
+if __name__=="__main__":
+	onCmdLine();
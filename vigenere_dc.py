@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+### vigenere_dc.py
+### Client for vigenere_d.py; a drop-in replacement for vigenere_kf.py that hands the work
+### to a running daemon instead of paying interpreter startup and key loading every time.
+### If no daemon is listening, the work is done in this process, as vigenere_kf.py would.
+
+import vigenere,vigenere_kf,vigenere_d,os,sys,json,struct,socket;
+
+# modes handled, and the request each one becomes (op, gz)
+MODES={
+	"encipher":("encipher",False),
+	"decipher":("decipher",False),
+	"encipher_nogz":("encipher",False),
+	"decipher_nogz":("decipher",False),
+	"verify":("verify",False)
+};
+# modes of vigenere_kf.py the daemon doesn't serve, which are done in this process instead
+LOCAL_MODES=("encipher_multi","rekey");
+
+# usage
+def usage(sname):
+	print("Usage:",sname,"[--socket PATH] [--stats json] [--workers N] [--membudget SIZE] MODE INPUT OUTPUT KEYFILE [OUTPUT KEYFILE ...]");
+	print("      ",sname,"[--socket PATH] [--stats json] [--workers N] [--membudget SIZE] rekey INPUT OUTPUT KEYFILE NEWKEYFILE");
+
+# full fledged help
+def helpmsg(sname):
+	usage(sname);
+	print("    MODE     Can be 'encipher', 'decipher', 'encipher_nogz', 'decipher_nogz', 'verify', 'encipher_multi', 'rekey', or 'help'");
+	print("             ('verify' deciphers INPUT and checks that it matches OUTPUT, without writing anything;");
+	print("             'encipher_multi' enciphers INPUT under each KEYFILE given, writing to the OUTPUT before it;");
+	print("             'rekey' re-enciphers INPUT, enciphered with KEYFILE, under NEWKEYFILE; these two are done");
+	print("             in this process, as vigenere_kf.py does them)");
+	print("    INPUT    Path to file to en/decipher");
+	print("    OUTPUT   Path to write en/deciphered file");
+	print("    KEYFILE  Path to key file");
+	print("    NEWKEYFILE  Path to key file to re-key with");
+	print("    --socket      Path to the daemon's socket (default $VIGENERE_SOCKET, or "+vigenere_d.defSocketPath()+")");
+	print("    --stats json  Write per-stage timing and throughput figures to stderr when done");
+	print("    --workers N   Number of processes to re-key with (default: from the tuning profile, or 1)");
+	print("    --membudget SIZE  Bytes the file buffers may take, e.g. 4M; buffers and queues are shrunk to fit");
+
+# connect to the daemon
+def connect(sockpath):
+	""" Connect to the daemon listening at sockpath, if it is run by this user.
+	:param sockpath: Path to the daemon's socket
+	:return: Connected socket, or None if no daemon is listening
+	:raise Exception: If the socket, or the process listening on it, belongs to another user
+	(who could otherwise fake the results of requests)
+	"""
+	try:
+		sockstat=os.stat(sockpath);
+	except FileNotFoundError:
+		return None;
+	if sockstat.st_uid!=os.getuid():
+		raise Exception("daemon socket "+sockpath+" belongs to another user");
+	sock=socket.socket(socket.AF_UNIX,socket.SOCK_STREAM);
+	try:
+		sock.connect(sockpath);
+	except (FileNotFoundError,ConnectionRefusedError):
+		sock.close();
+		return None;
+	# the socket file may have been swapped since it was checked, so check who is listening too
+	if hasattr(socket,"SO_PEERCRED"):
+		pid,uid,gid=struct.unpack("3i",sock.getsockopt(socket.SOL_SOCKET,socket.SO_PEERCRED,struct.calcsize("3i")));
+		if uid!=os.getuid():
+			sock.close();
+			raise Exception("daemon socket "+sockpath+" belongs to another user");
+	return sock;
+
+# send a request to the daemon and wait for the reply
+def doRequest(sock,mode,inpath,outpath,keypath,wantstats=False,membudget=None):
+	""" Ask the daemon to en/decipher or verify a file.
+	:param sock: Socket connected to the daemon
+	:param mode: One of MODES
+	:param inpath: Path to file to en/decipher
+	:param outpath: Path to write en/deciphered file (or, for 'verify', the expected plaintext)
+	:param keypath: Path to key file
+	:param wantstats: Whether to ask for stats
+	:param membudget: Number of bytes the daemon's file buffers may take for this request, if limited
+	:return: The daemon's reply
+	:raise Exception: With the same arguments as the exception raised in the daemon, if it failed
+	"""
+	if mode not in MODES:
+		raise Exception("no such mode",mode);
+	op,gz=MODES[mode];
+	vigenere_d.sendFrame(sock,{
+		"op":op,
+		"input":os.path.abspath(inpath),
+		"output":os.path.abspath(outpath),
+		"keyfile":os.path.abspath(keypath),
+		"gz":gz,
+		"stats":wantstats,
+		"membudget":membudget
+	});
+	reply=vigenere_d.recvFrame(sock);
+	if reply is None:
+		raise Exception("daemon closed the connection");
+	if not reply["ok"]:
+		raise Exception(*reply["args"]);
+	return reply;
+
+# command line mode, accept arguments
+def onCmdLine():
+	thisis=sys.argv[0];
+	args=sys.argv[:];
+	try:
+		sockpath=vigenere.popOpt(args,"--socket",vigenere_d.defSocketPath());
+		statsfmt=vigenere.popOpt(args,"--stats");
+	except ValueError:
+		usage(thisis);
+		exit(2);
+	try:
+		workers=vigenere.popOpt(args,"--workers");
+		if workers is not None and int(workers)<1:
+			raise ValueError("must be at least 1");
+		workers=(workers and int(workers) or None);
+	except ValueError:
+		usage(thisis);
+		print("Invalid number of workers; must be a whole number, at least 1");
+		exit(2);
+	try:
+		membudget=vigenere.popOpt(args,"--membudget");
+		membudget=(membudget and vigenere.parseSize(membudget) or None);
+	except ValueError:
+		usage(thisis);
+		print("Invalid memory budget; must be a number of bytes, optionally ending in K, M or G");
+		exit(2);
+	if statsfmt is not None and statsfmt!="json":
+		usage(thisis);
+		print("Invalid stats format; can only be 'json'");
+		exit(2);
+	if len(args)>=2 and args[1]=="help":
+		helpmsg(thisis);
+		exit(0);
+	if len(args)<5:
+		usage(thisis);
+		print("Try '"+thisis+" help' for more information.");
+		exit(2);
+	mode,inpath,outpath,keypath=args[1:5];
+	if mode not in MODES and mode not in LOCAL_MODES:
+		usage(thisis);
+		print("Invalid mode argument; can only be '"+"', '".join(list(MODES)+list(LOCAL_MODES))+"', or 'help'");
+		exit(2);
+	if mode=="rekey":
+		# new key file
+		extra=args[5:6];
+	else:
+		# more destination and key files, in pairs
+		extra=list(zip(args[5::2],args[6::2]));
+	if (mode=="rekey" and len(args)!=6) or (mode!="rekey" and (len(args[5:])%2 or (extra and mode!="encipher_multi"))):
+		usage(thisis);
+		print("Try '"+thisis+" help' for more information.");
+		exit(2);
+	sock=None;
+	try:
+		sock=(mode in MODES and connect(sockpath) or None);
+		if sock:
+			reply=doRequest(sock,mode,inpath,outpath,keypath,bool(statsfmt),membudget);
+			stats=reply.get("stats");
+			match=reply.get("match");
+		else:
+			# no daemon, or a mode it doesn't serve, do it ourselves
+			stats=(statsfmt and vigenere.Stats() or None);
+			match=None;
+			if mode=="verify":
+				raise Exception("verify needs a running daemon");
+			vigenere_kf.doMain(mode,inpath,outpath,keypath,stats,extra,workers,membudget);
+			stats=(stats and stats.asDict());
+	except Exception as exc:
+		vigenere_kf.explainError(thisis,exc);
+	finally:
+		if sock:
+			sock.close();
+	if match is False:
+		print("Deciphered file does not match",outpath);
+		exit(1);
+	# write stats
+	if stats:
+		print(json.dumps(stats,indent=1),file=sys.stderr);
+
+if __name__=="__main__":
+	onCmdLine();
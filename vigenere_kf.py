@@ -8,67 +8,155 @@ import vigenere,os,sys;
 
 # usage
 def usage(sname):
-	print("Usage:",sname,"MODE INPUT OUTPUT KEYFILE");
+	print("Usage:",sname,"[--stats json] [--workers N] [--membudget SIZE] MODE INPUT OUTPUT KEYFILE [OUTPUT KEYFILE ...]");
+	print("      ",sname,"[--stats json] [--workers N] [--membudget SIZE] rekey INPUT OUTPUT KEYFILE NEWKEYFILE");
 
 # full fledged help
 def helpmsg(sname):
 	usage(sname);
-	print("    MODE     Can be 'encipher', 'decipher', 'encipher_nogz', 'decipher_nogz', or 'help'");
+	print("    MODE     Can be 'encipher', 'decipher', 'encipher_nogz', 'decipher_nogz', 'encipher_multi', 'rekey', or 'help'");
+	print("             ('encipher_multi' enciphers INPUT under each KEYFILE given, writing to the OUTPUT before it,");
+	print("             reading INPUT only once; 'rekey' re-enciphers INPUT, enciphered with KEYFILE, under NEWKEYFILE,");
+	print("             without writing out the plaintext)");
 	print("    INPUT    Path to file to en/decipher");
 	print("    OUTPUT   Path to write en/deciphered file");
 	print("    KEYFILE  Path to key file");
+	print("    NEWKEYFILE  Path to key file to re-key with");
+	print("    --stats json  Write per-stage timing and throughput figures, and peak memory use, to stderr when done");
+	print("                  (run Python with -X tracemalloc to also have the peak of memory it traces reported)");
+	print("    --workers N   Number of processes to re-key with (default: from the tuning profile, or 1)");
+	print("    --membudget SIZE  Bytes the file buffers may take, e.g. 4M; buffers and queues are shrunk to fit");
 
-def doMain(mode,inpath,outpath,keypath):
+# read a key file
+def readKey(keypath):
+	try:
+		return vigenere.getMsg(keypath);
+	except FileNotFoundError:
+		raise Exception("no such keyfile",keypath);
+
+# refuse a zero-length key, before any output is touched
+def checkKey(key):
+	if len(key)<=0:
+		raise vigenere.ZeroKeyException("zero-length key");
+	return key;
+
+def doMain(mode,inpath,outpath,keypath,stats=None,extra=(),workers=None,membudget=None):
 	# check existence of files
 	if not os.access(inpath,os.F_OK):
 		raise Exception("no such plaintext",inpath);
 
 	# read key
-	try:
-		keylist=vigenere.getMsg(keypath);
-	except FileNotFoundError:
-		raise Exception("no such keyfile",keypath);
+	keylist=readKey(keypath);
 
 	# do encipher or decipher
 	if mode=="help":
 		helpmsg(sys.argv[0]);
 	elif mode=="encipher":
 		# encipher file
-		# (since doEn/DecodeWrite are generators, we must use a for loop;
-		# we can safely ignore the values yielded, as they are just status messages)
-		for amtdone,curblk,totalblks in vigenere.doEncodeWrite(inpath,outpath,keylist):
-			pass;
+		# (we don't need status messages, so use the blocking encodeFile/decodeFile)
+		vigenere.encodeFile(inpath,outpath,checkKey(keylist),stats=stats,membudget=membudget);
 	elif mode=="decipher":
 		# decipher file
-		for amtdone,curblk,totalblks in vigenere.doDecodeWrite(inpath,outpath,keylist):
-			pass;
+		vigenere.decodeFile(inpath,outpath,checkKey(keylist),stats=stats,membudget=membudget);
 	elif mode=="encipher_nogz":
 		# encipher file without compressing first
-		for amtdone,curblk,totalblks in vigenere.doEncodeWrite(inpath,outpath,keylist,gz=False):
-			pass;
+		vigenere.encodeFile(inpath,outpath,checkKey(keylist),gz=False,stats=stats,membudget=membudget);
 	elif mode=="decipher_nogz":
 		# decipher file, assume plaintext was not compressed
-		for amtdone,curblk,totalblks in vigenere.doDecodeWrite(inpath,outpath,keylist,gz=False):
-			pass;
+		vigenere.decodeFile(inpath,outpath,checkKey(keylist),gz=False,stats=stats,membudget=membudget);
+	elif mode=="encipher_multi":
+		# encipher file under several keys, reading it once
+		targets=[(outpath,keylist)]+[(extrapath,readKey(extrakey)) for extrapath,extrakey in extra];
+		for tpath,tkey in targets:
+			checkKey(tkey);
+		vigenere.encodeFileMulti(inpath,targets,stats=stats,membudget=membudget);
+	elif mode=="rekey":
+		# re-key enciphered file (extra holds the new key file)
+		newkey=checkKey(readKey(extra[0]));
+		vigenere.rekeyFile(inpath,outpath,checkKey(keylist),newkey,stats=stats,workers=workers,membudget=membudget);
 	else:
 		# invalid mode, raise error
 		raise Exception("no such mode",mode);
 
+# explain an exception raised by doMain() to the user and exit
+def explainError(thisis,exc):
+	# what went wrong?
+	excstr=exc.args[0];
+	if excstr.startswith("no such mode"):
+		# invalid mode argument
+		usage(thisis);
+		print("Invalid mode argument; can only be 'encipher', 'decipher',\
+		'encipher_nogz', 'decipher_nogz', 'encipher_multi', 'rekey', or 'help'");
+		exit(2);
+	elif excstr.startswith("no such plaintext"):
+		# input file does not exist
+		print("File to encipher given does not exist.");
+	elif excstr.startswith("no such keyfile"):
+		# key file does not exist
+		print("Key file given does not exist.");
+	elif excstr.startswith("zero-length key"):
+		# zero length key given
+		print("Key file given is zero bytes long.");
+	elif excstr.find("while decompressing")>-1:
+		# invalid key
+		print("Key file given does not match the one used to encipher the file.");
+	else:
+		# something else, display the exception
+		print(str(exc));
+	# regardless of what went wrong, exit with nonzero status
+	exit(1);
+
 def onCmdLine():
 	thisis=sys.argv[0];
+	args=sys.argv[:];
+	# get stats output format, if any
+	try:
+		statsfmt=vigenere.popOpt(args,"--stats");
+	except ValueError:
+		statsfmt="";
+	if statsfmt is not None and statsfmt!="json":
+		usage(thisis);
+		print("Invalid stats format; can only be 'json'");
+		exit(2);
+	# get number of worker processes, if given
+	try:
+		workers=vigenere.popOpt(args,"--workers");
+		if workers is not None and int(workers)<1:
+			raise ValueError("must be at least 1");
+		workers=(workers and int(workers) or None);
+	except ValueError:
+		usage(thisis);
+		print("Invalid number of workers; must be a whole number, at least 1");
+		exit(2);
+	# get memory budget, if given
+	try:
+		membudget=vigenere.popOpt(args,"--membudget");
+		membudget=(membudget and vigenere.parseSize(membudget) or None);
+	except ValueError:
+		usage(thisis);
+		print("Invalid memory budget; must be a number of bytes, optionally ending in K, M or G");
+		exit(2);
 	# get file paths
 	try:
 		# mode
-		mode=sys.argv[1];
+		mode=args[1];
 		# source file
-		inpath=sys.argv[2];
+		inpath=args[2];
 		# destination file
-		outpath=sys.argv[3];
+		outpath=args[3];
 		# key file
-		keypath=sys.argv[4];
+		keypath=args[4];
+		if mode=="rekey":
+			# new key file
+			extra=[args[5]];
+		else:
+			# more destination and key files, in pairs
+			extra=list(zip(args[5::2],args[6::2]));
+			if len(args[5:])%2 or (extra and mode!="encipher_multi"):
+				raise IndexError("unpaired or unexpected arguments");
 	except IndexError:
 		# user did not enter enough arguments
-		if len(sys.argv)>=2:
+		if len(args)>=2:
 			# only do this if they entered at least 1 argument
 			# otherwise we get an error
 			if mode=="help":
@@ -79,35 +167,17 @@ def onCmdLine():
 		usage(thisis);
 		print("Try '"+thisis+" help' for more information.");
 		exit(2);
+	# collect stats if they were asked for
+	stats=(statsfmt and vigenere.Stats() or None);
 	try:
 		# try to run encipher/decipher
-		doMain(mode,inpath,outpath,keypath);
+		doMain(mode,inpath,outpath,keypath,stats,extra,workers,membudget);
 	except Exception as exc:
-		# doMain() raised exception, what went wrong?
-		excstr=exc.args[0];
-		if excstr.startswith("no such mode"):
-			# invalid mode argument
-			usage(thisis);
-			print("Invalid mode argument; can only be 'encipher', 'decipher',\
-			'encipher_nogz', 'decipher_nogz', or 'help'");
-			exit(2);
-		elif excstr.startswith("no such plaintext"):
-			# input file does not exist
-			print("File to encipher given does not exist.");
-		elif excstr.startswith("no such keyfile"):
-			# key file does not exist
-			print("Key file given does not exist.");
-		elif excstr.startswith("zero-length key"):
-			# zero length key given
-			print("Key file given is zero bytes long.");
-		elif excstr.find("while decompressing")>-1:
-			# invalid key
-			print("Key file given does not match the one used to encipher the file.");
-		else:
-			# something else, display the exception
-			print(str(exc));
-		# regardless of what went wrong, exit with nonzero status
-		exit(1);
+		# doMain() raised exception, explain it and exit
+		explainError(thisis,exc);
+	# write stats
+	if stats:
+		print(stats.asJson(),file=sys.stderr);
 
 # invoke onCmdLine() if we are executing directly
 if __name__=="__main__":
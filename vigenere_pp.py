@@ -5,7 +5,7 @@
 ### enciphered with a user-specified passphrase and written to a separate file.
 ### Requires that os.urandom() / random.SystemRandom be available on your platform.
 
-import vigenere,os,sys;
+import vigenere,keypool,os,sys;
 from getpass import getpass;
 
 # key file extension
@@ -13,7 +13,7 @@ KEY_SUFFIX=".key";
 
 # usage
 def usage(sname):
-	print("Usage:",sname,"MODE INPUT OUTPUT [KEYSTRENGTH]");
+	print("Usage:",sname,"[--stats json] [--keypool DIR] MODE INPUT OUTPUT [KEYSTRENGTH]");
 
 # full fledged help
 def helpmsg(sname):
@@ -22,15 +22,24 @@ def helpmsg(sname):
 	print("    INPUT        Path to file to en/decipher");
 	print("    OUTPUT       Path to write en/deciphered file");
 	print("    KEYSTRENGTH  Number of characters to use in the generated key; only required when mode is 'encipher'");
+	print("    --stats json Write per-stage timing and throughput figures to stderr when done");
+	print("    --keypool    Take the generated key from a key pool directory kept filled by keypool.py,");
+	print("                 rather than generating it while enciphering");
+
+# print a progress report from encodeFile()/decodeFile()
+def showProgress(verb):
+	def showprog(prog):
+		print("[VIGENERE] {0}: {1:.2f}% done (block {2:d} of {3:d}, {4:.2f} KiB/s, {5:.1f}s left)".format(
+			verb,prog.amtdone*100,prog.curblk,prog.totalblks,prog.rate/1024,prog.eta
+		),file=sys.stderr);
+	return showprog;
 
 # encipher file
-def encode(ipath,opath,keypath,keystrength):
-	# generate key
-	randkey=os.urandom(keystrength);
-	# encipher and write file (since doEncodeWrite is a generator now, use a for loop)
-	# (we don't really care about the status messages here)
-	for amtdone,curblk,totalblks in vigenere.doEncodeWrite(ipath,opath,randkey):
-			print("[VIGENERE] Enciphering: {0:.2f}% done (block {1:d} of {2:d})".format(amtdone*100,curblk,totalblks),file=sys.stderr);
+def encode(ipath,opath,keypath,keystrength,stats=None,pool=None):
+	# take a key from the pool, or generate one
+	randkey=(pool and pool.take(keystrength) or os.urandom(keystrength));
+	# encipher and write file, showing progress twice a second
+	vigenere.encodeFile(ipath,opath,randkey,stats=stats,progress=showProgress("Enciphering"));
 	# interactively prompt for passphrase to protect key
 	passwd=bytes(getpass("Passphrase to encipher key with: "),"utf-8");
 	# disallow zero length passphrase
@@ -55,7 +64,7 @@ def encode(ipath,opath,keypath,keystrength):
 	print("Key is the file's name with '"+KEY_SUFFIX+"' appended at the end, in this case:",keypath);
 
 # decipher file
-def decode(ipath,opath,keypath):
+def decode(ipath,opath,keypath,stats=None):
 	# was keyfile included?
 	if not os.access(keypath,os.F_OK):
 		# it wasn't, raise error
@@ -69,8 +78,7 @@ def decode(ipath,opath,keypath):
 	# attempt to decipher file
 	try:
 		# decipher and write out file
-		for amtdone,curblk,totalblks in vigenere.doDecodeWrite(ipath,opath,randkey):
-			print("[VIGENERE] Deciphering: {0:.2f}% done (block {1:d} of {2:d})".format(amtdone*100,curblk,totalblks),file=sys.stderr);
+		vigenere.decodeFile(ipath,opath,randkey,stats=stats,progress=showProgress("Deciphering"));
 	except TypeError as err:
 		# TypeError: most likely, doDataDecode internally returned None
 		# due to invalid zlib header, indicating the passphrase is incorrect
@@ -90,15 +98,34 @@ def decode(ipath,opath,keypath):
 def onCmdLine():
 	# name of our script
 	thisis=sys.argv[0];
+	args=sys.argv[:];
+	# get stats output format, if any
+	try:
+		statsfmt=vigenere.popOpt(args,"--stats");
+	except ValueError:
+		statsfmt="";
+	if statsfmt is not None and statsfmt!="json":
+		usage(thisis);
+		print("Invalid stats format; can only be 'json'");
+		exit(2);
+	# get key pool directory, if any
+	try:
+		pooldir=vigenere.popOpt(args,"--keypool");
+	except ValueError:
+		usage(thisis);
+		print("--keypool needs the path to a key pool directory");
+		exit(2);
+	# collect stats if they were asked for
+	stats=(statsfmt and vigenere.Stats() or None);
 	# get mode and file path arguments
 	mode=None;
 	try:
 		# mode
-		mode=sys.argv[1];
+		mode=args[1];
 		# source path
-		inpath=sys.argv[2];
+		inpath=args[2];
 		# destination path
-		outpath=sys.argv[3];
+		outpath=args[3];
 	except IndexError:
 		# the user entered less than 3 arguments
 		if mode=="help":
@@ -119,7 +146,7 @@ def onCmdLine():
 		# note: the 4th argument ("KEYSTRENGTH") is required here
 		try:
 			# get key length
-			keystrength=int(sys.argv[4]);
+			keystrength=int(args[4]);
 		except IndexError:
 			# show usage, along with a note stating that KEYSTRENGTH is required when enciphering
 			usage(thisis);
@@ -127,14 +154,18 @@ def onCmdLine():
 			exit(2);
 		# encipher the file
 		# (the key file's name is the ciphertext file's name with '.key' appended to the end)
-		encode(inpath,outpath,(outpath+KEY_SUFFIX),keystrength);
+		encode(inpath,outpath,(outpath+KEY_SUFFIX),keystrength,stats,(pooldir and keypool.KeyPool(pooldir) or None));
 	elif mode=="decipher":
 		# decipher the specified ciphertext file
-		decode(inpath,outpath,(inpath+KEY_SUFFIX));
+		decode(inpath,outpath,(inpath+KEY_SUFFIX),stats);
 	else:
 		# invalid mode, show usage
 		usage(thisis);
 		print("Invalid mode argument; can only be 'encipher', 'decipher', or 'help'");
+		exit(2);
+	# write stats
+	if stats:
+		print(stats.asJson(),file=sys.stderr);
 
 if __name__=="__main__":
 	onCmdLine();
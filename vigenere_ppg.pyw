@@ -4,9 +4,9 @@
 ### Graphical equivalent of vigenere_pp.py.
 ### Requires that os.urandom() / random.SystemRandom be available on your platform.
 
-import vigenere,os,sys;
+import vigenere,keypool,os,sys,copy,json,queue,threading;
+import logging,logging.handlers;
 import graphics_o as g;
-from traceback import print_exc;
 from time import perf_counter;
 from datetime import datetime;
 
@@ -14,20 +14,98 @@ from datetime import datetime;
 KEY_SUFFIX=".key";
 # window title
 TITLE_DEF="Vigenere En/Decipher Demo";
+# how often to check on jobs running in the background (milliseconds)
+POLL_MS=50;
+# number of jobs run at once unless changed in the window
+WORKERS_DEF=2;
+# number of jobs shown in the job panel, and the height of each row
+JOBROWS=8;
+JOBROW_HEIGHT=26;
+# left and right ends of the progress bars in the job panel
+JOBBAR_X1=260;
+JOBBAR_X2=440;
 
-# whether or not we should point stdout at a log file
+# size a log file may grow to before it is rotated, and how many rotated logs to keep
+LOG_MAXBYTES=1024*1024;
+LOG_BACKUPS=3;
+
+# Formats log records as one JSON object per line
+class JsonLogFormatter(logging.Formatter):
+	# attributes every record has, which are not copied into the JSON object as extra fields
+	BASE_ATTRS=set(vars(logging.LogRecord("",0,"",0,"",(),None)))|{"message","asctime"};
+	def format(self,record):
+		entry={
+			"time":datetime.fromtimestamp(record.created).isoformat(),
+			"level":record.levelname,
+			"thread":record.threadName,
+			"msg":record.getMessage()
+		};
+		# extra fields given when logging (event, job details, ...)
+		for attr,val in vars(record).items():
+			if attr not in self.BASE_ATTRS:
+				entry[attr]=val;
+		if record.exc_info:
+			entry["exc"]=self.formatException(record.exc_info);
+		elif record.exc_text:
+			entry["exc"]=record.exc_text;
+		return json.dumps(entry,default=str);
+
+# Puts log records on the queue with their message and exception formatted separately
+# (QueueHandler.prepare() formats the exception into the message, so it would never reach the "exc" field)
+class JsonQueueHandler(logging.handlers.QueueHandler):
+	def prepare(self,record):
+		record=copy.copy(record);
+		record.msg=record.getMessage();
+		record.args=None;
+		# the traceback is formatted now, in the thread that raised it, rather than by the listener
+		if record.exc_info:
+			record.exc_text=logging.Formatter().formatException(record.exc_info);
+			record.exc_info=None;
+		return record;
+
+# File-like object that turns whatever is written to it into log records, a line at a time
+# (jobs print from several threads at once, and print() writes the text and the newline separately,
+# so each thread builds up its lines in a buffer of its own, to keep them from running into each other)
+class LogStream:
+	def __init__(self,logger,level):
+		self.logger=logger;
+		self.level=level;
+		self.local=threading.local();
+	def write(self,text):
+		lines=(getattr(self.local,"buf","")+text).split("\n");
+		self.local.buf=lines.pop();
+		for line in lines:
+			if line:
+				self.logger.log(self.level,line,extra={"event":"output"});
+	def flush(self):
+		pass;
+
+# whether or not we should log to a file
 logfile=True;
-# if specified open logfile and redirect stdout to it
+# log records go onto a queue, and a background thread writes them out,
+# so logging never holds up the window or the jobs
+log=logging.getLogger("vigenere_ppg");
+log.setLevel(logging.INFO);
+log.propagate=False;
+logqueue=queue.Queue();
+log.addHandler(JsonQueueHandler(logqueue));
+# if specified, write to a rotating logfile and redirect stdout and stderr to it
+if logfile:
+	loghandler=logging.handlers.RotatingFileHandler(sys.argv[0]+".log",maxBytes=LOG_MAXBYTES,backupCount=LOG_BACKUPS,encoding="utf-8",delay=True);
+else:
+	loghandler=logging.StreamHandler();
+loghandler.setFormatter(JsonLogFormatter());
+loglistener=logging.handlers.QueueListener(logqueue,loghandler);
+loglistener.start();
 if logfile:
-	logfile=open(sys.argv[0]+".log","a");
-	sys.stdout=logfile;
-	sys.stderr=logfile;
+	sys.stdout=LogStream(log,logging.INFO);
+	sys.stderr=LogStream(log,logging.ERROR);
 
 # start performance counter
 perf_counter();
 
 # encipher file
-def encode(ipath,opath,keypath,passwd,keystrength):
+def encode(ipath,opath,keypath,passwd,keystrength,pool=None,progress=None,cancel=None):
 	# does plaintext exist?
 	# (normally doEncodeWrite would do this check, but
 	# if keystrength is incorrect, key generation will
@@ -42,17 +120,18 @@ def encode(ipath,opath,keypath,passwd,keystrength):
 	# the key being written to file)
 	if len(passwd)<=0:
 		raise vigenere.ZeroKeyException("zero-length passphrase");
-	# generate key (raise ValueError if key strength is not valid as an integer literal)
-	randkey=os.urandom(int(keystrength));
-	# encipher file and yield back status messages
-	yield from vigenere.doEncodeWrite(ipath,opath,randkey);
+	# take a key from the pool, or generate one (raise ValueError if key strength is not valid as an integer literal)
+	keystrength=int(keystrength);
+	randkey=(pool and pool.take(keystrength) or os.urandom(keystrength));
+	# encipher file, reporting progress through the given callback
+	vigenere.encodeFile(ipath,opath,randkey,progress=progress,cancel=cancel);
 	# write protected key
 	ofile=open(keypath,"wb");
 	ofile.write(vigenere.doDataEncode(randkey,passwd));
 	ofile.close();
 
 # decipher file
-def decode(ipath,opath,keypath,passwd):
+def decode(ipath,opath,keypath,passwd,progress=None,cancel=None):
 	# does ciphertext exist?
 	if not os.access(ipath,os.F_OK):
 		# error if not
@@ -65,8 +144,67 @@ def decode(ipath,opath,keypath,passwd):
 	keyfile=open(keypath,"rb");
 	randkey=vigenere.doDataDecode(keyfile.read(),passwd);
 	keyfile.close();
-	# decipher file and yield back status messages
-	yield from vigenere.doDecodeWrite(ipath,opath,randkey);
+	# decipher file, reporting progress through the given callback
+	vigenere.decodeFile(ipath,opath,randkey,progress=progress,cancel=cancel);
+
+# An encode() or decode() call, run on a worker thread once started
+class Job:
+	def __init__(self,verb,func,args,onerror):
+		# "Enciphering" or "Deciphering"
+		self.verb=verb;
+		# function to run, its arguments (input path first, output path second),
+		# and function to describe an error it raises
+		self.func=func;
+		self.args=args;
+		self.onerror=onerror;
+		# messages from the worker thread: ("progress",Progress), ("done",None) or ("error",exception)
+		self.msgs=queue.Queue();
+		# set to stop the job at the next block boundary (or before it starts)
+		self.cancel=threading.Event();
+		self.thread=None;
+		# "queued", "running", "done", "error" or "cancelled", with a description and colour to show
+		self.state="queued";
+		self.status="Queued";
+		self.colour="gray";
+		# fraction done, and when the job started
+		self.amtdone=0.0;
+		self.starttime=None;
+	def start(self):
+		self.state="running";
+		self.status="Starting...";
+		self.colour="orange";
+		self.starttime=perf_counter();
+		self.thread=threading.Thread(target=self.run,daemon=True);
+		self.thread.start();
+	def run(self):
+		try:
+			self.func(*self.args,progress=(lambda prog: self.msgs.put(("progress",prog))),cancel=self.cancel);
+			self.msgs.put(("done",None));
+		except Exception as exc:
+			self.msgs.put(("error",exc));
+	def isFinished(self):
+		return self.state in ("done","error","cancelled");
+
+# List the (input, output) pairs to queue for an input and output path;
+# if the input is a directory, every file under it is queued, with outputs under the output directory
+def expandjobs(ipath,opath,skipkeys=False):
+	if not os.path.isdir(ipath):
+		return [(ipath,opath)];
+	pairs=[];
+	for dirpath,dirnames,filenames in os.walk(ipath):
+		dirnames.sort();
+		for fname in sorted(filenames):
+			# key files are deciphered along with the file they belong to
+			if skipkeys and fname.endswith(KEY_SUFFIX):
+				continue;
+			relpath=os.path.relpath(os.path.join(dirpath,fname),ipath);
+			# (a blank output path is left blank, so the job reports it)
+			pairs.append((os.path.join(ipath,relpath),(opath and os.path.join(opath,relpath) or "")));
+	# make the output directories
+	for ipath,opath in pairs:
+		if opath:
+			os.makedirs(os.path.dirname(opath),exist_ok=True);
+	return pairs;
 
 ### GUI functions begin here ###
 
@@ -106,6 +244,44 @@ def mkdrawbutton(p1,p2,colour,label,win):
 	# return the final object
 	return thisbtn;
 
+# One row of the job panel: file name, progress bar, and status
+class JobRow:
+	def __init__(self,win,y):
+		self.win=win;
+		self.y=y;
+		self.label=g.Text(g.Point(130,y),"");
+		self.label.draw(win);
+		g.Rectangle(g.Point(JOBBAR_X1,y-8),g.Point(JOBBAR_X2,y+8)).draw(win);
+		# filled part of the progress bar, and the fraction and colour it was drawn with
+		self.bar=None;
+		self.barstate=(0.0,None);
+		self.status=g.Text(g.Point(585,y),"");
+		self.status.draw(win);
+	# Show a job in this row (or clear it, if job is None)
+	def show(self,job):
+		if job is None:
+			self.label.setText("");
+			self.status.setText("");
+			self.setbar(0.0,None);
+			return;
+		name=job.verb[:3]+": "+os.path.basename(job.args[0]);
+		self.label.setText(len(name)>26 and name[:23]+"..." or name);
+		self.status.setText(len(job.status)>36 and job.status[:33]+"..." or job.status);
+		self.status.setTextColor(job.colour);
+		self.setbar(job.amtdone,job.colour);
+	# Redraw the filled part of the progress bar, if it has changed
+	def setbar(self,amtdone,colour):
+		if (amtdone,colour)==self.barstate:
+			return;
+		self.barstate=(amtdone,colour);
+		if self.bar:
+			self.bar.undraw();
+			self.bar=None;
+		if amtdone>0:
+			self.bar=g.Rectangle(g.Point(JOBBAR_X1,self.y-8),g.Point(JOBBAR_X1+(JOBBAR_X2-JOBBAR_X1)*amtdone,self.y+8));
+			self.bar.setFill(colour);
+			self.bar.draw(self.win);
+
 # Main graphics handler
 def doGuiMain(win):
 	# Encipher interface
@@ -144,129 +320,198 @@ def doGuiMain(win):
 	# Clear form button
 	btnClear=mkdrawbutton(g.Point(560,130),g.Point(680,170),"orange","Clear fields",win);
 	
+	# Worker limit
+	g.Text(g.Point(60,315),"Workers").draw(win);
+	entryWorkers=mkdrawentry(g.Point(120,315),4,win);
+	entryWorkers.setText(str(WORKERS_DEF));
+	
+	# Cancel button
+	btnCancel=mkdrawbutton(g.Point(300,300),g.Point(420,330),"gray","Cancel all",win);
+	
 	# Status message
 	labelStatmsg=g.Text(g.Point(360,280),"Initialising...");
 	labelStatmsg.setTextColor("orange");
 	labelStatmsg.draw(win);
 	# Update status message
 	def updatestat(text,color):
-		# update the shown status message
-		labelStatmsg.setTextColor(color);
-		labelStatmsg.setText(text);
-		# log the status message with timestamp
-		print("[{0: >8.8f}] [VIGENERE] Stat msg: {1}".format(perf_counter(),text));
+		# update the shown status message (redrawing once for both changes)
+		with win.batch():
+			labelStatmsg.setTextColor(color);
+			labelStatmsg.setText(text);
+		# log the status message
+		log.info(text,extra={"event":"status"});
 	# Update window title with a prefix in [] ([ERROR] or [WORKING] or [DONE])
 	def titlepfix(win,prefix=None):
 		ftitle=(prefix and "["+prefix.upper()+"] " or "")+TITLE_DEF;
 		win.master.title(ftitle);
 	
+	# Job panel
+	g.Text(g.Point(40,360),"Jobs").draw(win);
+	labelJobsum=g.Text(g.Point(360,360),"No jobs");
+	labelJobsum.draw(win);
+	rows=[JobRow(win,390+JOBROW_HEIGHT*i) for i in range(JOBROWS)];
+	
+	# Describe an error raised while enciphering
+	def encodeerror(err):
+		if isinstance(err,FileNotFoundError):
+			# FileNotFoundError: Specified input file not found
+			return "Input file not found";
+		elif isinstance(err,vigenere.ZeroValException):
+			# ZeroValException: Output file path was zero bytes long
+			return "No value entered for output file";
+		elif isinstance(err,vigenere.ZeroKeyException):
+			# ZeroKeyException: Passphrase was zero bytes long
+			return "No value entered for passphrase";
+		elif isinstance(err,ValueError):
+			# ValueError: int() could not parse provided key strength
+			return "No or invalid value entered for key strength";
+		# Catch all for exceptions not caught above
+		# Write exception info and traceback
+		log.error("Exception during enciphering",exc_info=(type(err),err,err.__traceback__),extra={"event":"exception"});
+		return "Unknown error, see log for details";
+	# Describe an error raised while deciphering
+	def decodeerror(err):
+		if isinstance(err,FileNotFoundError):
+			# FileNotFoundError: One of two things; either...
+			if err.args[0].startswith("This file has no associated key"):
+				# ...the key file corresponding to our input was not found...
+				return "File's associated key not found";
+			# ...or the input was not found.
+			return "Input file not found";
+		elif isinstance(err,TypeError):
+			# TypeError: A call to doDataDecode returned None; usually this means the passphrase is incorrect
+			return "Passphrase is incorrect";
+		elif isinstance(err,vigenere.ZeroValException):
+			# ZeroValException: Output field is blank
+			return "No value entered for output file";
+		elif isinstance(err,vigenere.ZeroKeyException):
+			# ZeroKeyException: Key provided was zero bytes long
+			return "Key provided was zero bytes long, or passphrase field is empty";
+		# Catch all for exceptions not caught above
+		# Write exception info and traceback
+		log.error("Exception during deciphering",exc_info=(type(err),err,err.__traceback__),extra={"event":"exception"});
+		return "Unknown error, see log for details";
+	
+	# Every job queued since the program started, in the order they were queued
+	jobs=[];
+	# Keys generated in the background, ready for the key strengths in use
+	keys=keypool.KeyPool().start();
+	# Whether pollJobs is scheduled to run
+	polling=False;
+	# Number of jobs that may run at once
+	def workerlimit():
+		try:
+			return max(1,int(entryWorkers.getText()));
+		except ValueError:
+			return WORKERS_DEF;
+	# Queue jobs
+	def queuejobs(newjobs):
+		nonlocal polling;
+		jobs.extend(newjobs);
+		updatestat("Queued {0:d} job(s)".format(len(newjobs)),"orange");
+		titlepfix(win,"working");
+		if not polling:
+			polling=True;
+			win.after(0,polljobs);
+	# Log a finished job
+	def logjob(job):
+		log.info("{0} {1}: {2}".format(job.verb,job.args[0],job.status),extra={
+			"event":"job",
+			"state":job.state,
+			"verb":job.verb,
+			"input":job.args[0],
+			"output":job.args[1],
+			"seconds":(job.starttime and perf_counter()-job.starttime or 0.0)
+		});
+	# Check on running jobs, show any messages they have sent back, and start queued jobs when there is room
+	def polljobs():
+		nonlocal polling;
+		for job in jobs:
+			if job.state!="running":
+				continue;
+			try:
+				while True:
+					kind,val=job.msgs.get_nowait();
+					if kind=="progress":
+						job.amtdone=val.amtdone;
+						job.status="{0:.1f}% ({1:.1f} KiB/s, {2:.0f}s left)".format(val.amtdone*100,val.rate/1024,val.eta);
+					elif kind=="done":
+						tdelta=perf_counter()-job.starttime;
+						job.state,job.amtdone,job.colour="done",1.0,"green";
+						job.status="Done in {0:.2f}s".format(tdelta);
+						logjob(job);
+					elif isinstance(val,vigenere.CancelledException):
+						job.state,job.colour,job.status="cancelled","gray","Cancelled";
+						logjob(job);
+					else:
+						job.state,job.colour,job.status="error","red",job.onerror(val);
+						logjob(job);
+			except queue.Empty:
+				pass;
+		# start queued jobs while there is room
+		running=sum(1 for job in jobs if job.state=="running");
+		for job in jobs:
+			if running>=workerlimit():
+				break;
+			if job.state=="queued":
+				if job.cancel.is_set():
+					job.state,job.status="cancelled","Cancelled";
+					logjob(job);
+					continue;
+				job.start();
+				running+=1;
+		showjobs();
+		# keep polling until every job has finished
+		if any(not job.isFinished() for job in jobs):
+			win.after(POLL_MS,polljobs);
+		else:
+			polling=False;
+			failed=sum(1 for job in jobs if job.state=="error");
+			updatestat("All jobs finished"+(failed and ", {0:d} failed".format(failed) or ""),(failed and "red" or "green"));
+			titlepfix(win,(failed and "error" or "done"));
+	# Redraw the job panel: running jobs first, then queued ones, then the most recently finished
+	def showjobs():
+		order={"running":0,"queued":1};
+		shown=sorted(enumerate(jobs),key=lambda ij: (order.get(ij[1].state,2),(ij[1].isFinished() and -ij[0] or ij[0])));
+		shown=[job for i,job in shown[:JOBROWS]];
+		counts={};
+		for job in jobs:
+			counts[job.state]=counts.get(job.state,0)+1;
+		with win.batch():
+			for i,row in enumerate(rows):
+				row.show(i<len(shown) and shown[i] or None);
+			labelJobsum.setText(", ".join("{0:d} {1}".format(counts[state],state) for state in ("running","queued","done","error","cancelled") if state in counts) or "No jobs");
+	
 	# initialising finished, update status and write to logfile
-	print("[{0: >8.8f}] [VIGENERE] Successful initialisation at {1}".format(perf_counter(),datetime.now().isoformat()));
+	log.info("Successful initialisation",extra={"event":"start"});
 	updatestat("Ready","green");
 	
-	# Click handler
-	while True:
-		# Get click
-		click=win.getMouse();
+	# Click handler, called from the Tk event loop for every click
+	def onclick(click):
 		# Handle click on button
 		if isInRect(click,btnEncipher):
-			# Encipher button clicked, encipher and update status
-			try:
-				# Change status message to orange "enciphering in progress"
-				updatestat("Enciphering in progress...","orange");
-				# Prefix window title: "[WORKING]"
-				titlepfix(win,"working");
-				# Call encode() to do the actual enciphering; it will yield back doEncodeWrite()'s status messages
-				for amtdone,curblk,totalblks in encode(
-					entryEIFile.getText(),
-					entryEOFile.getText(),
-					entryEOFile.getText()+KEY_SUFFIX,
-					bytes(entryEPassphrase.getText(),"utf-8"),
-					entryEKeylen.getText()
-				):
-					# update status message with new status yield
-					updatestat("Enciphering: {0:.2f}% done (block {1:d} of {2:d})".format(amtdone*100,curblk,totalblks),"orange");
-				# Change status message to green "file enciphered"
-				updatestat("File "+entryEIFile.getText()+" enciphered as "+entryEOFile.getText()+", using key "+entryEOFile.getText()+KEY_SUFFIX,"green");
-				# Prefix window title: "[DONE]"
-				titlepfix(win,"done");
-			# Errors
-			# For all handled errors, procedures are as follows:
-			#	Write red status message describing the error
-			#	Prefix window title: "[ERROR]"
-			except FileNotFoundError:
-				# FileNotFoundError: Specified input file not found
-				updatestat("Input file not found","red");
-				titlepfix(win,"error");
-			except vigenere.ZeroValException:
-				# ZeroValException: Output file path was zero bytes long
-				updatestat("No value entered for output file","red");
-				titlepfix(win,"error");
-			except vigenere.ZeroKeyException:
-				# ZeroKeyException: Passphrase was zero bytes long
-				updatestat("No value entered for passphrase","red");
-				titlepfix(win,"error");
-			except ValueError:
-				# ValueError: int() could not parse provided key strength
-				updatestat("No or invalid value entered for key strength","red");
-				titlepfix(win,"error");
-			except Exception:
-				# Catch all for exceptions not caught above
-				updatestat("Unknown error, see log for details","red");
-				titlepfix(win,"error");
-				# Write exception info and traceback
-				print("[{0: >8.8f}] [VIGENERE] Exception during enciphering:".format(perf_counter()));
-				print_exc();
-		
+			# Encipher button clicked, queue a job for the input file (or each file in the input directory)
+			# encode() does the actual enciphering and reports progress back
+			passwd=bytes(entryEPassphrase.getText(),"utf-8");
+			keystrength=entryEKeylen.getText();
+			queuejobs([
+				Job("Enciphering",encode,(ipath,opath,opath+KEY_SUFFIX,passwd,keystrength,keys),encodeerror)
+				for ipath,opath in expandjobs(entryEIFile.getText(),entryEOFile.getText())
+			]);
 		elif isInRect(click,btnDecipher):
-			# Decipher button clicked, decipher and update status
-			try:
-				# Change status message to orange "deciphering in progress"
-				updatestat("Deciphering in progress...","orange");
-				# Prefix window title: "[WORKING]"
-				titlepfix(win,"working");
-				# Call decode() to do the actual deciphering; it will yield back doDecodeWrite()'s status messages
-				for amtdone,curblk,totalblks in decode(
-					entryDIFile.getText(),
-					entryDOFile.getText(),
-					entryDIFile.getText()+KEY_SUFFIX,
-					bytes(entryDPassphrase.getText(),"utf-8")
-				):
-					# update status message with new status yield
-					updatestat("Deciphering: {0:.2f}% done (block {1:d} of {2:d})".format(amtdone*100,curblk,totalblks),"orange");
-				# Change status message to green "file <ciphertext> deciphered as <new plaintext>"
-				updatestat("File {0} deciphered as {1}".format(entryDIFile.getText(),entryDOFile.getText()),"green");
-				# Prefix window title: "[DONE]"
-				titlepfix(win,"done");
-			# Errors (procedures same as above)
-			except FileNotFoundError as err:
-				# FileNotFoundError: One of two things; either...
-				if err.args[0].startswith("This file has no associated key"):
-					# ...the key file corresponding to our input was not found...
-					updatestat("File's associated key not found; should be: "+entryDIFile.getText()+KEY_SUFFIX,"red");
-				else:
-					# ...or the input was not found.
-					updatestat("Input file not found","red");
-				titlepfix(win,"error");
-			except TypeError:
-				# TypeError: A call to doDataDecode returned None; usually this means the passphrase is incorrect
-				updatestat("Passphrase is incorrect","red");
-				titlepfix(win,"error");
-			except vigenere.ZeroValException:
-				# ZeroValException: Output field is blank
-				updatestat("No value entered for output file","red");
-				titlepfix(win,"error");
-			except vigenere.ZeroKeyException:
-				# ZeroKeyException: Key provided was zero bytes long
-				updatestat("Key provided was zero bytes long, or passphrase field is empty","red");
-				titlepfix(win,"error");
-			except Exception:
-				# Catch all for exceptions not caught above
-				updatestat("Unknown error, see log for details","red");
-				titlepfix(win,"error");
-				# Write exception info and traceback
-				print("[{0: >8.8f}] [VIGENERE] Exception during deciphering:".format(perf_counter()),file=sys.stderr);
-				print_exc();
+			# Decipher button clicked, queue a job for the input file (or each file in the input directory)
+			# decode() does the actual deciphering and reports progress back
+			passwd=bytes(entryDPassphrase.getText(),"utf-8");
+			queuejobs([
+				Job("Deciphering",decode,(ipath,opath,ipath+KEY_SUFFIX,passwd),decodeerror)
+				for ipath,opath in expandjobs(entryDIFile.getText(),entryDOFile.getText(),skipkeys=True)
+			]);
+		elif isInRect(click,btnCancel):
+			# Cancel button clicked, stop running jobs at the next block boundary and drop queued ones
+			if any(not job.isFinished() for job in jobs):
+				updatestat("Cancelling...","orange");
+				for job in jobs:
+					job.cancel.set();
 		elif isInRect(click,btnClear):
 			# Clear all fields
 			# Encipher fields
@@ -282,30 +527,36 @@ def doGuiMain(win):
 			updatestat("Ready","green");
 			# Reset window title
 			titlepfix(win);
-		# flush logfile buffer
-		logfile.flush();
+	win.setMouseHandler(onclick);
+	
+	# Handle events until the window is closed
+	try:
+		win.waitClose();
+	finally:
+		# don't leave half-written files behind if the window is closed mid-job
+		for job in jobs:
+			job.cancel.set();
+		for job in jobs:
+			if job.thread:
+				job.thread.join();
+		keys.stop();
 
 # main
 if __name__=="__main__":
 	# initialise main graphics window
-	gwin=g.GraphWin(TITLE_DEF,720,300);
+	gwin=g.GraphWin(TITLE_DEF,720,390+JOBROW_HEIGHT*JOBROWS);
 	# start actual program
 	try:
 		doGuiMain(gwin);
+		log.info("Window closed, exiting.",extra={"event":"exit"});
 	except g.GraphicsError as err:
-		if err.args[0].startswith("getMouse in closed window"):
-			print("[{0: >8.8f}] [VIGENERE] Window closed, exiting.".format(perf_counter()),file=sys.stderr);
-		else:
-			print("[{0: >8.8f}] [VIGENERE] Graphics exception:".format(perf_counter()),file=sys.stderr);
-			print_exc();
+		log.exception("Graphics exception",extra={"event":"exception"});
 	except KeyboardInterrupt as err:
-		print("[{0: >8.8f}] [VIGENERE] Keyboard interrupt sent, exiting.".format(perf_counter()),file=sys.stderr);
+		log.info("Keyboard interrupt sent, exiting.",extra={"event":"exit"});
 	except Exception as err:
-		print("[{0: >8.8f}] [VIGENERE] Fatal exception:".format(perf_counter()),file=sys.stderr);
-		print_exc();
+		log.exception("Fatal exception",extra={"event":"exception"});
 	finally:
-		if logfile:
-			print("[{0: >8.8f}] [VIGENERE] End of this run.".format(perf_counter()),);
-			print("-"*40);
-			logfile.close();
+		log.info("End of this run.",extra={"event":"end"});
+		# write out whatever is still queued
+		loglistener.stop();
 		exit(0);
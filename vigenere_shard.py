@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+
+### vigenere_shard.py
+### Splits the enciphering of one large file into shards that can be enciphered independently,
+### for instance by several machines sharing a filesystem, and puts the results back together.
+### Shards are whole numbers of blocks. Since each key block is derived from the one before it,
+### 'plan' works out the key block each shard carries on from once, and writes it to a state file
+### beside the manifest; a node enciphering a shard then needs only the key, its state file, and
+### its byte range of the input. State files are derived from the key, and must be kept as safe.
+### Files are not compressed (as with vigenere_kf.py's '_nogz' modes), so shards are the same
+### length as their byte ranges and the merged ciphertext is the same as vigenere_kf.py writes.
+
+import vigenere,vigenere_kf,os,sys,json,shutil;
+from hashlib import sha256;
+from math import ceil;
+from itertools import islice;
+from concurrent.futures import ProcessPoolExecutor;
+
+# name of the manifest in a shard directory
+MANIFEST="manifest.json";
+# version of the manifest format
+MANIFEST_VERSION=1;
+
+# usage
+def usage(sname):
+	print("Usage:",sname,"plan INPUT KEYFILE SHARDS DIR");
+	print("      ",sname,"run DIR INDEX INPUT KEYFILE");
+	print("      ",sname,"[--workers N] shard INPUT KEYFILE SHARDS DIR");
+	print("      ",sname,"merge DIR OUTPUT");
+	print("      ",sname,"[--workers N] decipher DIR OUTPUT KEYFILE");
+
+# full fledged help
+def helpmsg(sname):
+	usage(sname);
+	print("    plan      Split INPUT into SHARDS shards, writing a manifest and key state files to DIR");
+	print("    run       Encipher shard INDEX of a plan (what each node runs)");
+	print("    shard     Plan, then encipher every shard at once, each in its own process");
+	print("    merge     Check the enciphered shards and join them into one enciphered file");
+	print("    decipher  Decipher the enciphered shards at once, each in its own process, into one file");
+	print("    INPUT     Path to file to encipher");
+	print("    KEYFILE   Path to key file");
+	print("    SHARDS    Number of shards");
+	print("    DIR       Directory holding the manifest, key states and enciphered shards");
+	print("    INDEX     Number of the shard to encipher, from 0");
+	print("    OUTPUT    Path to write the joined or deciphered file to");
+	print("    --workers Number of processes to use (default: number of CPUs)");
+
+# paths of a shard's files
+def shardPath(dirpath,index,suffix):
+	return os.path.join(dirpath,"{0:04d}.{1}".format(index,suffix));
+
+# read a plan's manifest
+def readManifest(dirpath):
+	try:
+		with open(os.path.join(dirpath,MANIFEST)) as mfile:
+			manifest=json.load(mfile);
+	except FileNotFoundError:
+		raise Exception("no such manifest",os.path.join(dirpath,MANIFEST));
+	if manifest.get("version")!=MANIFEST_VERSION or manifest.get("blksize")!=vigenere.BLKSIZE:
+		raise Exception("manifest is for another version or block size");
+	return manifest;
+
+# split a file into shards
+def doPlan(inpath,keypath,nshards,dirpath):
+	""" Split the file at inpath into nshards byte ranges of whole blocks, and write the manifest
+	and the key block each shard carries on from to dirpath.
+	:param inpath: Path to file to encipher
+	:param keypath: Path to key file
+	:param nshards: Number of shards, at least 1 (fewer are made if the file has fewer blocks)
+	:param dirpath: Directory to write to
+	:return: The manifest
+	"""
+	if not os.access(inpath,os.F_OK):
+		raise Exception("no such plaintext",inpath);
+	if nshards<=0:
+		raise Exception("number of shards must be at least 1, not "+str(nshards));
+	key=vigenere_kf.readKey(keypath);
+	if len(key)<=0:
+		raise vigenere.ZeroKeyException("zero-length key");
+	size=os.path.getsize(inpath);
+	totalblks=ceil(size/vigenere.BLKSIZE);
+	perblks=max(1,ceil(totalblks/nshards));
+	os.makedirs(dirpath,exist_ok=True);
+	shards=[];
+	# walk the key schedule once, saving the key block before the start of each shard
+	keysched=vigenere.genKeyBlocks(key);
+	prev=None;
+	for index,startblk in enumerate(range(0,max(totalblks,1),perblks)):
+		if startblk:
+			for prev in islice(keysched,perblks):
+				pass;
+			with open(os.open(shardPath(dirpath,index,"state"),os.O_WRONLY|os.O_CREAT|os.O_TRUNC,0o600),"wb") as sfile:
+				sfile.write(prev);
+		offset=startblk*vigenere.BLKSIZE;
+		shards.append({
+			"index":index,
+			"offset":offset,
+			"length":min(perblks*vigenere.BLKSIZE,size-offset),
+			"state":(startblk and os.path.basename(shardPath(dirpath,index,"state")) or None),
+			"output":os.path.basename(shardPath(dirpath,index,"part"))
+		});
+	manifest={
+		"version":MANIFEST_VERSION,
+		"blksize":vigenere.BLKSIZE,
+		"input":os.path.abspath(inpath),
+		"size":size,
+		"shards":shards
+	};
+	with open(os.path.join(dirpath,MANIFEST),"w") as mfile:
+		json.dump(manifest,mfile,indent=1);
+	return manifest;
+
+# encipher or decipher one shard
+def doShard(dirpath,index,inpath,keypath,decode=False,opath=None):
+	""" Encipher shard index of the plan in dirpath from its byte range of inpath, or decipher it.
+	:param dirpath: Directory holding the plan
+	:param index: Number of the shard
+	:param inpath: Path to the file the plan was made for (or, to decipher, the enciphered shard)
+	:param keypath: Path to key file
+	:param decode: Whether to decipher rather than encipher
+	:param opath: Path to write to, if not the shard's output file in dirpath
+	:return: Path written to
+	"""
+	manifest=readManifest(dirpath);
+	if not 0<=index<len(manifest["shards"]):
+		raise Exception("no such shard",index);
+	shard=manifest["shards"][index];
+	key=vigenere_kf.readKey(keypath);
+	if len(key)<=0:
+		raise vigenere.ZeroKeyException("zero-length key");
+	prev=None;
+	if shard["state"]:
+		with open(os.path.join(dirpath,shard["state"]),"rb") as sfile:
+			prev=sfile.read();
+	keysched=vigenere.genKeyBlocks(key,prev);
+	if decode:
+		vigenere.decodeFile(inpath,opath,key,keysched=keysched,workers=1);
+		return opath;
+	opath=(opath or os.path.join(dirpath,shard["output"]));
+	if os.path.getsize(inpath)!=manifest["size"]:
+		raise Exception("input has changed since it was planned",inpath);
+	# (shards are already processed in parallel, so don't start more processes per shard)
+	vigenere.encodeFile(inpath,opath,key,keysched=keysched,span=(shard["offset"],shard["length"]),workers=1);
+	# record a checksum for merge to check
+	hsh=sha256();
+	with open(opath,"rb") as ofile:
+		for chunk in iter(lambda: ofile.read(vigenere.PIPE_BUFSIZE),b""):
+			hsh.update(chunk);
+	with open(opath+".sha256","w") as hfile:
+		hfile.write(hsh.hexdigest());
+	return opath;
+
+# check the enciphered shards of a plan
+def checkShards(dirpath,manifest):
+	""" Check every shard of a plan has been enciphered, and its output is intact.
+	:param dirpath: Directory holding the plan
+	:param manifest: The plan's manifest
+	:return: List of paths of the enciphered shards, in order
+	"""
+	paths=[];
+	for shard in manifest["shards"]:
+		opath=os.path.join(dirpath,shard["output"]);
+		try:
+			with open(opath+".sha256") as hfile:
+				want=hfile.read().strip();
+		except FileNotFoundError:
+			raise Exception("shard not enciphered",shard["index"]);
+		hsh=sha256();
+		with open(opath,"rb") as ofile:
+			for chunk in iter(lambda: ofile.read(vigenere.PIPE_BUFSIZE),b""):
+				hsh.update(chunk);
+		if os.path.getsize(opath)!=shard["length"] or hsh.hexdigest()!=want:
+			raise Exception("shard is damaged",shard["index"]);
+		paths.append(opath);
+	return paths;
+
+# join files into one
+def joinFiles(paths,outpath):
+	with open(outpath,"wb") as ofile:
+		for path in paths:
+			with open(path,"rb") as ifile:
+				shutil.copyfileobj(ifile,ofile,vigenere.PIPE_BUFSIZE);
+
+# command line mode, accept arguments
+def onCmdLine():
+	thisis=sys.argv[0];
+	args=sys.argv[:];
+	try:
+		workers=vigenere.popOpt(args,"--workers");
+		if workers is not None and int(workers)<1:
+			raise ValueError("must be at least 1");
+		workers=(workers and int(workers) or None);
+	except ValueError:
+		usage(thisis);
+		print("Invalid number of workers; must be a whole number, at least 1");
+		exit(2);
+	mode=(len(args)>=2 and args[1] or None);
+	if mode=="help":
+		helpmsg(thisis);
+		exit(0);
+	# get the number of shards (plan, shard) or the shard index (run)
+	try:
+		if mode in ("plan","shard") and len(args)>=6:
+			number=int(args[4]);
+		elif mode=="run" and len(args)>=6:
+			number=int(args[3]);
+	except ValueError:
+		usage(thisis);
+		print("SHARDS and INDEX must be numbers");
+		exit(2);
+	try:
+		if mode=="plan" and len(args)>=6:
+			manifest=doPlan(args[2],args[3],number,args[5]);
+			print("Planned",len(manifest["shards"]),"shard(s) in",args[5]);
+		elif mode=="run" and len(args)>=6:
+			print("Wrote",doShard(args[2],number,args[4],args[5]));
+		elif mode=="shard" and len(args)>=6:
+			manifest=doPlan(args[2],args[3],number,args[5]);
+			# each process stands in for a node
+			with ProcessPoolExecutor(workers) as pool:
+				futs=[pool.submit(doShard,args[5],shard["index"],args[2],args[3]) for shard in manifest["shards"]];
+				for fut in futs:
+					fut.result();
+			print("Enciphered",len(manifest["shards"]),"shard(s) in",args[5]);
+		elif mode=="merge" and len(args)>=4:
+			joinFiles(checkShards(args[2],readManifest(args[2])),args[3]);
+			print("Merged shards into",args[3]);
+		elif mode=="decipher" and len(args)>=5:
+			manifest=readManifest(args[2]);
+			paths=checkShards(args[2],manifest);
+			plainpaths=[path+".plain" for path in paths];
+			try:
+				with ProcessPoolExecutor(workers) as pool:
+					futs=[
+						pool.submit(doShard,args[2],shard["index"],path,args[4],True,plainpath)
+						for shard,path,plainpath in zip(manifest["shards"],paths,plainpaths)
+					];
+					for fut in futs:
+						fut.result();
+				joinFiles(plainpaths,args[3]);
+			finally:
+				for plainpath in plainpaths:
+					if os.path.exists(plainpath):
+						os.remove(plainpath);
+			print("Deciphered shards into",args[3]);
+		else:
+			usage(thisis);
+			print("Try '"+thisis+" help' for more information.");
+			exit(2);
+	except Exception as exc:
+		vigenere_kf.explainError(thisis,exc);
+
+if __name__=="__main__":
+	onCmdLine();